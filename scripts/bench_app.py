@@ -0,0 +1,190 @@
+"""
+End-to-end benchmark: serve the app against scripts/mock_gateway.py and drive its pages with concurrent clients.
+
+    python scripts/bench_app.py [--watchlists 5] [--instruments 100] [--clients 10] [--server uvicorn]
+    python scripts/bench_app.py --latency 100 --rate-limit 10 --scenario portfolio --scenario contract --json out.json
+
+Seeds N watchlists of M instruments in a scratch data directory, starts the app on it,
+then has K clients hit each scenario and reports p50/p99 latency and the gateway calls
+it caused. Background threads (quote poller, order tracker) keep running, so their
+calls during a scenario are counted too.
+"""
+import argparse, json, os, random, shutil, socket, statistics, subprocess, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(__file__))
+import mock_gateway
+
+SCENARIOS = ("watchlists", "watchlist", "portfolio", "scanner", "contract", "upload")
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def seed_watchlists(workdir, watchlists, instruments):
+    """Create the watchlists in workdir/webapp/data the same way the app stores them"""
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from webapp.models.watchlist import add_many_to_watchlist, create_watchlist
+        names = [f"bench{i}" for i in range(watchlists)]
+        for i, name in enumerate(names):
+            create_watchlist(name)
+            add_many_to_watchlist(name, [
+                {"symbol": f"SYM{n}", "conid": mock_gateway.BASE_CONID + n, "company_name": f"SYM{n} Corp", "description": "NASDAQ"}
+                for n in range(i * instruments, (i + 1) * instruments)
+            ])
+        return names
+    finally:
+        os.chdir(cwd)
+
+def server_command(server, port):
+    """The start.sh command for a server, with the repo paths made absolute so it can run from the scratch directory"""
+    webapp = os.path.join(ROOT, "webapp")
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "-c", os.path.join(webapp, "gunicorn.conf.py"), "-b", f"127.0.0.1:{port}", "webapp.app:app"]
+    if server == "flask":
+        return [sys.executable, "-m", "flask", "--app", os.path.join(webapp, "app"), "run", "-p", str(port), "--with-threads"]
+    return [sys.executable, "-m", "uvicorn", "webapp.asgi:asgi_app", "--app-dir", ROOT, "--port", str(port), "--log-level", "warning"]
+
+def start_app(options, workdir, gateway_url, port):
+    env = dict(
+        os.environ,
+        IBKR_GATEWAY_URL=gateway_url,
+        FLASK_SECRET_KEY="bench",
+        WEB_CONCURRENCY=str(options.workers)
+    )
+    process = subprocess.Popen(server_command(options.server, port), cwd=workdir, env=env,
+                               stdout=None if options.verbose else subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{options.server} exited with status {process.returncode}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/metrics", timeout=2).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{options.server} did not start within 60s")
+
+def scenario_request(name, client, base, names, options):
+    """Make one request for a scenario; returns the response"""
+    universe = options.watchlists * options.instruments
+    if name == "watchlists":
+        return client.get(f"{base}/watchlists")
+    if name == "watchlist":
+        return client.get(f"{base}/watchlists/{random.choice(names)}")
+    if name == "portfolio":
+        return client.get(f"{base}/portfolio")
+    if name == "scanner":
+        return client.get(f"{base}/scanner", params={
+            "submitted": "1", "instrument": "STK", "location": "STK.US.MAJOR",
+            "sort": f"SCAN_{random.randrange(options.scan_types)}", "filter": "f1", "filter_value": "1"
+        })
+    if name == "contract":
+        return client.get(f"{base}/contract/{mock_gateway.BASE_CONID + random.randrange(universe)}/365d")
+    if name == "upload":
+        start = random.randrange(max(1, universe - options.instruments))
+        content = "symbol\n" + "".join(f"SYM{n}\n" for n in range(start, start + options.instruments))
+        return client.post(f"{base}/watchlists/{random.choice(names)}/upload",
+                           files={"file": ("bench.csv", content.encode(), "text/csv")})
+    raise ValueError(f"Unknown scenario {name}")
+
+def run_scenario(name, base, names, options, gateway):
+    def client_loop(_):
+        latencies, errors = [], 0
+        with requests.Session() as client:
+            for _ in range(options.requests):
+                started = time.perf_counter()
+                try:
+                    r = scenario_request(name, client, base, names, options)
+                    errors += r.status_code >= 400
+                except requests.RequestException:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+        return latencies, errors
+
+    gateway.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.clients) as executor:
+        outcomes = list(executor.map(client_loop, range(options.clients)))
+    elapsed = time.perf_counter() - started
+    stats = gateway.stats()
+    latencies = [seconds for client_latencies, _ in outcomes for seconds in client_latencies]
+    return {
+        "scenario": name,
+        "requests": len(latencies),
+        "errors": sum(errors for _, errors in outcomes),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "rps": round(len(latencies) / elapsed, 1),
+        "gateway_calls": stats["total"],
+        "gateway_throttled": sum(stats["throttled"].values()),
+        "gateway_by_endpoint": stats["calls"],
+        "gateway_throttled_by_endpoint": stats["throttled"]
+    }
+
+def print_report(results):
+    print(f"{'scenario':<12}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}{'req/s':>8}{'gw calls':>10}{'429s':>6}")
+    for result in results:
+        print(f"{result['scenario']:<12}{result['requests']:>9}{result['errors']:>8}{result['p50_ms']:>9}{result['p99_ms']:>9}"
+              f"{result['mean_ms']:>9}{result['rps']:>8}{result['gateway_calls']:>10}{result['gateway_throttled']:>6}")
+        for endpoint, count in sorted(result["gateway_by_endpoint"].items(), key=lambda item: -item[1]):
+            print(f"{'':<14}{count:>6}  {endpoint}")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1], parents=[mock_gateway.build_parser()], conflict_handler="resolve")
+    parser.add_argument("--port", type=int, default=0, help="mock gateway port (0 picks a free one)")
+    parser.add_argument("--watchlists", type=int, default=5, help="N watchlists to seed")
+    parser.add_argument("--instruments", type=int, default=100, help="M instruments per watchlist and per uploaded CSV")
+    parser.add_argument("--clients", type=int, default=10, help="K concurrent clients")
+    parser.add_argument("--requests", type=int, default=10, help="requests per client per scenario")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="scenarios to run (default: all)")
+    parser.add_argument("--scan-types", type=int, default=5, help="distinct scans the scanner scenario picks from")
+    parser.add_argument("--server", choices=("uvicorn", "gunicorn", "flask"), default="uvicorn")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds to let background threads settle before measuring")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch data directory")
+    parser.add_argument("--verbose", action="store_true", help="show the app server's output")
+    return parser
+
+if __name__ == "__main__":
+    options = build_parser().parse_args()
+    options.port = options.port or free_port()
+    options.universe = max(options.universe, options.watchlists * options.instruments)
+    server, gateway = mock_gateway.serve(options)
+    gateway_url = f"http://{options.host}:{options.port}{mock_gateway.PREFIX}"
+
+    workdir = tempfile.mkdtemp(prefix="bench-app-")
+    names = seed_watchlists(workdir, options.watchlists, options.instruments)
+    app_port = free_port()
+    process = start_app(options, workdir, gateway_url, app_port)
+    print(f"{options.server} on :{app_port}, mock gateway on {gateway_url}, data in {workdir}")
+    print(f"{options.watchlists} watchlists x {options.instruments} instruments, {options.clients} clients x {options.requests} requests")
+    try:
+        time.sleep(options.warmup)
+        base = f"http://127.0.0.1:{app_port}"
+        results = [run_scenario(name, base, names, options, gateway) for name in options.scenario or SCENARIOS]
+        print_report(results)
+        if options.json:
+            with open(options.json, "w") as f:
+                json.dump({"options": {k: v for k, v in vars(options).items() if k not in ("latency_for", "endpoint_limit")},
+                           "results": results}, f, indent=2)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        server.shutdown()
+        if not options.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,82 @@
+"""
+Compare the streaming CSV ingestion path against the original whole-string parser.
+
+    python scripts/bench_csv_ingest.py [rows]
+"""
+import csv, io, os, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from webapp.models.csv_ingest import iter_csv_symbols
+
+def legacy_process_csv_content(content):
+    """The original app.process_csv_content, kept here as the baseline"""
+    symbols = []
+    try:
+        dialect = csv.Sniffer().sniff(content)
+        has_header = csv.Sniffer().has_header(content)
+        lines = content.splitlines()
+        reader = csv.reader(lines, dialect)
+        if has_header:
+            headers = next(reader)
+            symbol_col = None
+            for i, header in enumerate(headers):
+                if header.lower().strip() in ['symbol', 'symbols', 'ticker', 'tickers']:
+                    symbol_col = i
+                    break
+            if symbol_col is not None:
+                for row in reader:
+                    if len(row) > symbol_col:
+                        symbol = row[symbol_col].strip().upper()
+                        if symbol:
+                            symbols.append(symbol)
+            else:
+                for row in reader:
+                    if row:
+                        symbol = row[0].strip().upper()
+                        if symbol:
+                            symbols.append(symbol)
+        else:
+            for row in reader:
+                if row:
+                    symbol = row[0].strip().upper()
+                    if symbol:
+                        symbols.append(symbol)
+    except Exception as e:
+        lines = content.splitlines()
+        for line in lines:
+            symbol = line.strip().upper()
+            if symbol and not symbol.lower().startswith('symbol'):
+                symbols.append(symbol)
+    return list(set(symbols))
+
+def screener_export(rows):
+    """A screener-style export: BOM, header row, symbol in the second column, some duplicates"""
+    out = io.StringIO()
+    out.write('\ufeff')
+    writer = csv.writer(out)
+    writer.writerow(["No.", "Ticker", "Company", "Sector", "Price", "Change", "Volume"])
+    for i in range(rows):
+        writer.writerow([i + 1, f"T{i % (rows // 2 or 1):05d}", f"Company {i}", "Technology", f"{10 + i % 500}.25", "1.5%", 1000 + i])
+    return out.getvalue().encode('utf-8')
+
+def measure(label, fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    symbols = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {elapsed * 1000:9.1f} ms  peak {peak / 1024 / 1024:7.2f} MiB  {len(symbols)} symbols")
+    return symbols
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    payload = screener_export(rows)
+    print(f"{rows} rows, {len(payload) / 1024 / 1024:.2f} MiB upload")
+
+    legacy = measure("legacy", lambda: legacy_process_csv_content(payload.decode('UTF-8')))
+    streaming = measure("streaming", lambda: list(iter_csv_symbols(io.BytesIO(payload))))
+
+    # The legacy path returns symbols in set order, so only compare membership
+    if set(legacy) != set(streaming):
+        print("WARNING: symbol sets differ")
@@ -0,0 +1,80 @@
+"""
+Local stand-in for the Client Portal market data websocket, for exercising the quote stream.
+
+    pip install websockets
+    python scripts/fake_gateway_ws.py [--port 5057] [--rate 2]
+    IBKR_STREAM_URL=ws://127.0.0.1:5057/v1/api/ws QUOTE_STREAM=1 flask --app app run
+
+Accepts smd+<conid>+{...} / umd+<conid>+{} and pushes random-walk updates for every
+subscribed conid; each update only carries the fields that changed, like the gateway.
+"""
+import argparse, asyncio, json, random, time
+import websockets
+
+FIELDS = ("31", "32", "33", "34")
+
+class Instrument:
+    def __init__(self, conid):
+        self.conid = conid
+        self.close = round(random.uniform(10, 500), 2)
+        self.price = self.close
+        self.volume = 0
+
+    def tick(self):
+        """Fields that changed since the last tick, formatted the way the gateway sends them"""
+        fields = {}
+        if random.random() < 0.8:
+            self.price = round(max(0.01, self.price * (1 + random.gauss(0, 0.001))), 2)
+            change = self.price - self.close
+            fields.update({"31": f"{self.price:.2f}", "32": f"{change:.2f}", "33": f"{change / self.close * 100:.2f}%"})
+        if random.random() < 0.5:
+            self.volume += random.randint(100, 5000)
+            fields["34"] = f"{self.volume / 1000:.1f}K"
+        return fields
+
+async def serve_client(websocket, rate, stats):
+    subscriptions = {}
+    await websocket.send(json.dumps({"topic": "system", "success": "fake-gateway"}))
+    await websocket.send(json.dumps({"topic": "sts", "args": {"authenticated": True}}))
+
+    async def push():
+        while True:
+            for conid, instrument in list(subscriptions.items()):
+                fields = instrument.tick()
+                if fields:
+                    message = dict(fields, topic=f"smd+{conid}", conid=int(conid), _updated=int(time.time() * 1000))
+                    await websocket.send(json.dumps(message))
+                    stats["updates"] += 1
+            await asyncio.sleep(1 / rate)
+
+    pusher = asyncio.create_task(push())
+    try:
+        async for message in websocket:
+            if message.startswith("smd+"):
+                conid = message.split("+")[1]
+                subscriptions.setdefault(conid, Instrument(conid))
+            elif message.startswith("umd+"):
+                subscriptions.pop(message.split("+")[1], None)
+            elif message == "tic":
+                await websocket.send(json.dumps({"topic": "tic", "alive": True}))
+            stats["subscribed"] = len(subscriptions)
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        pusher.cancel()
+
+async def main(host, port, rate):
+    stats = {"updates": 0, "subscribed": 0}
+    async with websockets.serve(lambda ws: serve_client(ws, rate, stats), host, port):
+        print(f"Fake gateway websocket on ws://{host}:{port}/v1/api/ws, {rate} updates/s per conid")
+        while True:
+            await asyncio.sleep(5)
+            print(f"{stats['subscribed']} conids subscribed, {stats['updates']} updates sent")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5057)
+    parser.add_argument("--rate", type=float, default=2, help="updates per second per subscribed conid")
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.rate))
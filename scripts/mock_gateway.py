@@ -0,0 +1,302 @@
+"""
+Local mock of the Client Portal gateway endpoints the app uses, for benchmarks and offline work.
+
+    python scripts/mock_gateway.py [--port 5058] [--latency 50] [--rate-limit 10] [--positions 250]
+    IBKR_GATEWAY_URL=http://127.0.0.1:5058/v1/api sh start.sh
+
+Instrument n is symbol SYM<n> with conid 100000 + n. Latency, rate limits and payload
+sizes are configurable; /__stats returns call counts per endpoint and /__reset clears them.
+"""
+import argparse, json, math, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PREFIX = "/v1/api"
+BASE_CONID = 100000
+# The gateway returns positions 100 to a page
+POSITIONS_PAGE_SIZE = 100
+
+class Bucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+def endpoint_of(path):
+    return re.sub(r"/(?:[A-Z]{1,3}\d+|\d+|r?[0-9a-f]{8,}[0-9a-f-]*)(?=/|$)", "/{id}", path)
+
+def conid_of(symbol):
+    match = re.fullmatch(r"SYM(\d+)", symbol.upper())
+    return BASE_CONID + int(match.group(1)) if match else BASE_CONID + 50000 + sum(map(ord, symbol.upper())) * 7919 % 50000
+
+def price_of(conid):
+    return 20 + conid % 480 + (conid * 37 % 100) / 100
+
+class MockGateway:
+    def __init__(self, options):
+        self.options = options
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.throttled = {}
+        self.orders = {}
+        # reply id -> orders waiting for confirmation
+        self.pending = {}
+        self.next_order = 1
+        self.global_bucket = Bucket(options.rate_limit) if options.rate_limit else None
+        self.buckets = {path: Bucket(rate) for path, rate in options.endpoint_limit}
+        self.latencies = dict(options.latency_for)
+        self.accounts = [f"DU{1000000 + i}" for i in range(options.accounts)]
+
+    def count(self, table, endpoint):
+        with self.lock:
+            table[endpoint] = table.get(endpoint, 0) + 1
+
+    def allowed(self, path):
+        for prefix, bucket in self.buckets.items():
+            if path.startswith(prefix) and not bucket.take():
+                return False
+        return self.global_bucket is None or self.global_bucket.take()
+
+    def delay(self, path):
+        latency = next((ms for prefix, ms in self.latencies.items() if path.startswith(prefix)), self.options.latency)
+        time.sleep(max(0, latency + random.uniform(-self.options.jitter, self.options.jitter)) / 1000)
+
+    def stats(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "throttled": dict(self.throttled), "total": sum(self.calls.values())}
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.throttled.clear()
+
+    # Endpoint handlers: (method, path, query, body) -> (status, payload)
+
+    def handle(self, method, path, query, body):
+        o = self.options
+        if path == "/portfolio/accounts":
+            return 200, [{"id": a, "accountId": a, "displayName": a, "currency": "USD"} for a in self.accounts]
+        match = re.fullmatch(r"/portfolio/([^/]+)/positions/(\d+)", path)
+        if match:
+            page = int(match.group(2))
+            start = page * POSITIONS_PAGE_SIZE
+            return 200, [self.position(n) for n in range(start, min(o.positions, start + POSITIONS_PAGE_SIZE))]
+        if re.fullmatch(r"/portfolio/[^/]+/summary", path):
+            return 200, {
+                "totalcashvalue": {"amount": 25000.0, "currency": "USD"},
+                "netliquidation": {"amount": 100000.0 + o.positions * 1000, "currency": "USD"}
+            }
+        if path == "/iserver/marketdata/snapshot":
+            conids = [c for c in query.get("conids", [""])[0].split(",") if c]
+            return 200, [self.snapshot(int(c)) for c in conids if c.isdigit()]
+        if path == "/iserver/secdef/search":
+            symbol = query.get("symbol", [""])[0]
+            conid = conid_of(symbol)
+            return 200, [
+                {"conid": conid + i * 1000000, "symbol": symbol.upper(), "companyName": f"{symbol.upper()} Corp",
+                 "companyHeader": f"{symbol.upper()} Corp - NASDAQ", "description": "NASDAQ",
+                 "sections": [{"secType": "STK"}]}
+                for i in range(o.search_results)
+            ]
+        if path == "/trsrv/secdef":
+            return 200, {"secdef": [self.secdef(int(c)) for c in (body or {}).get("conids", [])]}
+        if path == "/iserver/marketdata/history":
+            return 200, self.history(int(query.get("conid", ["0"])[0]), query.get("period", ["5d"])[0])
+        if path == "/iserver/scanner/params":
+            return 200, self.scanner_params()
+        if path == "/iserver/scanner/run":
+            return 200, {"contracts": [
+                {"con_id": BASE_CONID + n, "symbol": f"SYM{n}", "company_name": f"SYM{n} Corp"}
+                for n in random.sample(range(o.universe), min(o.scan_results, o.universe))
+            ]}
+        if path == "/iserver/account/orders":
+            with self.lock:
+                return 200, {"orders": list(self.orders.values()), "snapshot": True}
+        match = re.fullmatch(r"/iserver/account/([^/]+)/orders", path)
+        if match and method == "POST":
+            reply_id = f"r{random.getrandbits(48):012x}"
+            with self.lock:
+                self.pending[reply_id] = (body or {}).get("orders", [])
+            return 200, [{"id": reply_id, "message": ["Mock order warning"]}]
+        match = re.fullmatch(r"/iserver/reply/([^/]+)", path)
+        if match:
+            return 200, [self.place_order(order) for order in self.pending_orders(match.group(1), body)]
+        match = re.fullmatch(r"/iserver/account/([^/]+)/order/([^/]+)", path)
+        if match and method == "DELETE":
+            with self.lock:
+                order = self.orders.get(match.group(2))
+                if order:
+                    order["status"] = "Cancelled"
+            return 200, {"msg": "Request was submitted", "order_id": match.group(2)}
+        if path == "/tickle":
+            return 200, {"session": "mock-session", "iserver": {"authStatus": {"authenticated": True}}}
+        return 404, {"error": f"Mock gateway has no {method} {path}"}
+
+    def position(self, n):
+        conid = BASE_CONID + n % self.options.universe
+        price = price_of(conid)
+        quantity = 10 + n % 90
+        return {
+            "conid": conid, "name": f"SYM{n % self.options.universe} Corp", "contractDesc": f"SYM{n % self.options.universe}",
+            "position": quantity, "avgCost": round(price * 0.95, 2), "mktPrice": price,
+            "mktValue": round(price * quantity, 2), "unrealizedPnl": round(price * 0.05 * quantity, 2),
+            "currency": "USD", "assetClass": "STK"
+        }
+
+    def snapshot(self, conid):
+        price = price_of(conid) * (1 + random.gauss(0, 0.002))
+        change = price - price_of(conid)
+        return {"conid": conid, "31": f"{price:.2f}", "32": f"{change:.2f}",
+                "33": f"{change / price_of(conid) * 100:.2f}%", "34": f"{conid % 900 + 100}.0K"}
+
+    def secdef(self, conid):
+        n = conid - BASE_CONID
+        return {"conid": conid, "ticker": f"SYM{n}", "name": f"SYM{n} Corp", "companyName": f"SYM{n} Corp",
+                "listingExchange": "NASDAQ", "currency": "USD", "assetClass": "STK"}
+
+    def history(self, conid, period):
+        match = re.fullmatch(r"(\d+)\s*(min|h|d|w|m|y)", period.lower())
+        days = int(match.group(1)) * {"min": 1 / 1440, "h": 1 / 24, "d": 1, "w": 7, "m": 30, "y": 365}[match.group(2)] if match else 5
+        bars = max(1, min(self.options.bars, math.ceil(days)))
+        today = int(time.time() // 86400 * 86400 * 1000)
+        # Seeded per conid so a contract's history is the same on every call
+        rng = random.Random(conid)
+        close = price_of(conid)
+        data = []
+        for i in range(bars):
+            close = max(1, close * (1 + rng.gauss(0, 0.015)))
+            data.append({"t": today - (bars - 1 - i) * 86400000, "o": round(close * 0.995, 2), "h": round(close * 1.01, 2),
+                         "l": round(close * 0.99, 2), "c": round(close, 2), "v": 100000 + i})
+        return {"symbol": f"SYM{conid - BASE_CONID}", "data": data, "points": bars}
+
+    def scanner_params(self):
+        filters = [{"group": f"filter{i}", "display_name": f"Filter {i}", "type": "non-range", "code": f"f{i}"} for i in range(200)]
+        return {
+            "instrument_list": [{"type": t, "display_name": t, "filters": [f["group"] for f in filters]} for t in ("STK", "ETF.EQ.US")],
+            "filter_list": filters,
+            "scan_type_list": [{"display_name": f"Scan {i}", "code": f"SCAN_{i}", "instruments": ["STK", "ETF.EQ.US"]} for i in range(100)],
+            "location_tree": [{"type": t, "locations": [{"type": "STK.US.MAJOR", "display_name": "US Majors"}]} for t in ("STK", "ETF.EQ.US")]
+        }
+
+    def pending_orders(self, reply_id, body):
+        with self.lock:
+            orders = self.pending.pop(reply_id, [])
+        return orders if (body or {}).get("confirmed") else []
+
+    def place_order(self, order):
+        with self.lock:
+            order_id = str(self.next_order)
+            self.next_order += 1
+            self.orders[order_id] = {
+                "orderId": int(order_id), "conid": order.get("conid"), "ticker": f"SYM{order.get('conid', BASE_CONID) - BASE_CONID}",
+                "side": order.get("side"), "status": "Submitted", "orderType": order.get("orderType", "LMT"),
+                "totalSize": order.get("quantity"), "companyName": "Mock Corp", "description1": "Mock order", "orderDesc": "Mock order", "order_ref": order.get("cOID")
+            }
+        return {"order_id": order_id, "order_status": "Submitted", "local_order_id": order.get("cOID")}
+
+def make_handler(gateway):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def respond(self, status, payload, headers=()):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def dispatch(self, method):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if url.path == "/__stats":
+                return self.respond(200, gateway.stats())
+            if url.path == "/__reset":
+                gateway.reset()
+                return self.respond(200, {"reset": True})
+            if not url.path.startswith(PREFIX):
+                return self.respond(404, {"error": "not found"})
+            path = url.path[len(PREFIX):]
+            endpoint = endpoint_of(path)
+            if not gateway.allowed(path):
+                gateway.count(gateway.throttled, endpoint)
+                return self.respond(429, {"error": "Too many requests"}, [("Retry-After", "1")])
+            gateway.count(gateway.calls, endpoint)
+            gateway.delay(path)
+            try:
+                body = json.loads(raw) if raw else None
+            except ValueError:
+                body = None
+            status, payload = gateway.handle(method, path, parse_qs(url.query), body)
+            self.respond(status, payload)
+
+        def do_GET(self):
+            self.dispatch("GET")
+
+        def do_POST(self):
+            self.dispatch("POST")
+
+        def do_DELETE(self):
+            self.dispatch("DELETE")
+
+    return Handler
+
+def parse_pair(value, cast):
+    prefix, _, number = value.partition("=")
+    return prefix if prefix.startswith("/") else "/" + prefix, cast(number)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5058)
+    parser.add_argument("--latency", type=float, default=50, help="mean response latency in ms")
+    parser.add_argument("--jitter", type=float, default=10, help="uniform latency jitter in ms")
+    parser.add_argument("--latency-for", action="append", default=[], type=lambda v: parse_pair(v, float),
+                        metavar="PATH=MS", help="latency for an endpoint prefix, e.g. /iserver/marketdata/history=400")
+    parser.add_argument("--rate-limit", type=float, default=0, help="global requests per second before 429s (0 = unlimited)")
+    parser.add_argument("--endpoint-limit", action="append", default=[], type=lambda v: parse_pair(v, float),
+                        metavar="PATH=RATE", help="requests per second for an endpoint prefix, e.g. /iserver/scanner/run=1")
+    parser.add_argument("--accounts", type=int, default=1)
+    parser.add_argument("--positions", type=int, default=250, help="positions per account")
+    parser.add_argument("--universe", type=int, default=5000, help="distinct instruments")
+    parser.add_argument("--bars", type=int, default=365, help="maximum bars per history response")
+    parser.add_argument("--scan-results", type=int, default=50)
+    parser.add_argument("--search-results", type=int, default=3)
+    return parser
+
+def serve(options):
+    """Start the mock in a background thread; returns (server, gateway)"""
+    gateway = MockGateway(options)
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(gateway))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-gateway", daemon=True).start()
+    return server, gateway
+
+if __name__ == "__main__":
+    options = build_parser().parse_args()
+    server, gateway = serve(options)
+    print(f"Mock gateway on http://{options.host}:{options.port}{PREFIX}")
+    try:
+        while True:
+            time.sleep(10)
+            stats = gateway.stats()
+            print(f"{stats['total']} calls, {sum(stats['throttled'].values())} throttled")
+    except KeyboardInterrupt:
+        server.shutdown()
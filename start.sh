@@ -1,3 +1,9 @@
 cd gateway && sh bin/run.sh root/conf.yaml &
-cd webapp && python3 -m venv venv && . venv/bin/activate && venv/bin/pip install flask requests
-flask --app app run --debug -p 5056 -h 0.0.0.0
\ No newline at end of file
+cd webapp && python3 -m venv venv && . venv/bin/activate && venv/bin/pip install -r requirements.txt
+if [ "$SERVE_MODE" = "production" ]; then
+    gunicorn -c gunicorn.conf.py webapp.app:app
+elif [ "$SERVE_MODE" = "asgi" ]; then
+    uvicorn webapp.asgi:asgi_app --app-dir .. --host 0.0.0.0 --port 5056
+else
+    flask --app app run --debug -p 5056 -h 0.0.0.0
+fi
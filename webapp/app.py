@@ -1,113 +1,148 @@
-import requests, time, os, csv, io
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+import logging, requests, threading, time, os, io
+from flask import Flask, render_template, request, redirect, url_for, flash, session, make_response, jsonify, Response, g
+from flask import before_render_template, template_rendered
+from markupsafe import escape
+from webapp.models import gateway, metrics, staging, symbol_cache
+from webapp.models.account import check_auth, get_account_id
+from webapp.models.analytics import analyse_contract, analyse_many
+from webapp.models.bars import UNIT_SECONDS, duration_seconds
+from webapp.models.basket import read_csv_orders, submit_basket
+from webapp.models.contracts import get_contracts, load_contract_page
+from webapp.models.csv_ingest import iter_csv_symbols
+from webapp.models.orders import get_orders, order_events, refresh_orders, request_refresh, start_tracker, tracker_running, update_order
+from webapp.models.portfolio import aggregate_portfolio, get_positions
+from webapp.models.quotes import start_poller
+from webapp.models.scanner import get_catalog, run_scan, run_scans
+from webapp.models.streaming import quote_events, start_stream
+from webapp.models.symbols import resolve_symbols, search_symbol
 from webapp.models.watchlist import (
-    get_watchlists, create_watchlist, add_to_watchlist, 
-    remove_from_watchlist, delete_watchlist
+    get_watchlists, load_watchlists, create_watchlist, add_to_watchlist, 
+    add_many_to_watchlist, remove_from_watchlist, delete_watchlist,
+    get_watchlist_conids, get_watchlist_instruments
 )
 
-# disable warnings until you install a certificate
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-BASE_API_URL = "https://localhost:5055/v1/api"
-ACCOUNT_ID = os.environ.get('IBKR_ACCOUNT_ID')
-
 os.environ['PYTHONHTTPSVERIFY'] = '0'
 
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+SECRET_KEY_FILE = 'webapp/data/secret_key'
+# Every open event stream holds a request thread, so cap them per process to keep threads for normal requests
+MAX_EVENT_STREAMS = int(os.environ.get('MAX_EVENT_STREAMS', 16))
+# Streams end after this long and the browser reconnects; under ASGI a disconnected client is otherwise never noticed
+EVENT_STREAM_MAX_AGE = float(os.environ.get('EVENT_STREAM_MAX_AGE', 300))
+
+def load_secret_key():
+    """FLASK_SECRET_KEY, or a key generated once and kept on disk so every worker signs sessions alike"""
+    if os.environ.get('FLASK_SECRET_KEY'):
+        return os.environ['FLASK_SECRET_KEY']
+    if not os.path.exists(SECRET_KEY_FILE):
+        os.makedirs(os.path.dirname(SECRET_KEY_FILE), exist_ok=True)
+        tmp = f"{SECRET_KEY_FILE}.{os.getpid()}"
+        with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            f.write(os.urandom(32).hex())
+        try:
+            os.link(tmp, SECRET_KEY_FILE)  # fails if another worker got there first
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    with open(SECRET_KEY_FILE, 'r') as f:
+        return f.read().strip()
+
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # Required for flash messages and session
+app.secret_key = load_secret_key()  # Required for flash messages and session
+
+symbol_cache.warm(get_watchlist_instruments())
+
+# The websocket stream replaces REST polling when enabled
+if os.environ.get('QUOTE_STREAM', '0') == '1':
+    start_stream(get_watchlist_conids)
+elif os.environ.get('QUOTE_POLLER', '1') == '1':
+    start_poller(get_watchlist_conids)
+
+if os.environ.get('ORDER_TRACKER', '1') == '1':
+    start_tracker()
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    # Set on every request, profiled or not, so a worker thread never reports into an earlier request's profile
+    g.profile, g.profile_token = metrics.start_profile(metrics.profiling_requested(request.args))
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    elapsed = time.perf_counter() - g.get("request_started", time.perf_counter())
+    metrics.observe("http_request_duration_seconds", elapsed, route=route, method=request.method)
+    metrics.inc("http_requests_total", route=route, method=request.method, status=response.status_code)
+    profile = g.get("profile")
+    if profile:
+        server_timing, breakdown = metrics.summarize_profile(profile)
+        response.headers["Server-Timing"] = server_timing
+        app.logger.info("%s %s: %s", request.method, request.path, breakdown)
+    return response
+
+@app.teardown_request
+def end_request_profile(exception):
+    token = g.pop("profile_token", None)
+    if token is not None:
+        metrics.end_profile(token)
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_render_time(sender, template, context, **extra):
+    if "render_started" in g:
+        metrics.record_render(time.perf_counter() - g.pop("render_started"))
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint; each worker process reports its own counters"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+_event_stream_slots = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+def _until_max_age(events):
+    deadline = time.monotonic() + EVENT_STREAM_MAX_AGE
+    try:
+        for event in events:
+            yield event
+            if time.monotonic() >= deadline:
+                break
+    finally:
+        events.close()
+
+def event_stream(events):
+    """Server-sent events response, or a 503 once MAX_EVENT_STREAMS streams are open in this process"""
+    if not _event_stream_slots.acquire(blocking=False):
+        return Response("Too many open event streams", status=503, headers={"Retry-After": "30"})
+    response = Response(_until_max_age(events), mimetype="text/event-stream")
+    # Runs when the server closes the response, including after the client disconnects
+    response.call_on_close(_event_stream_slots.release)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 @app.template_filter('ctime')
 def timectime(s):
     return time.ctime(s/1000)
 
-def check_auth():
-    """Check if user is authenticated with IBKR"""
-    try:
-        r = requests.get(f"{BASE_API_URL}/portfolio/accounts", verify=False)
-        return r.status_code == 200 and r.content and 'error' not in r.json()
-    except:
-        return False
-
-def get_account_id():
-    """Get the first available account ID"""
-    try:
-        r = requests.get(f"{BASE_API_URL}/portfolio/accounts", verify=False)
-        if r.status_code == 200 and r.content:
-            accounts = r.json()
-            if accounts and len(accounts) > 0:
-                return accounts[0]['id']
-    except:
-        pass
-    return ACCOUNT_ID
-
-def process_csv_content(content):
-    """Process CSV content and return list of symbols"""
-    symbols = []
-    try:
-        # Try first with automatic dialect detection
-        dialect = csv.Sniffer().sniff(content)
-        has_header = csv.Sniffer().has_header(content)
-        
-        # Read CSV content
-        lines = content.splitlines()
-        reader = csv.reader(lines, dialect)
-        
-        # If has header, process accordingly
-        if has_header:
-            headers = next(reader)
-            # Try to find symbol column
-            symbol_col = None
-            for i, header in enumerate(headers):
-                if header.lower().strip() in ['symbol', 'symbols', 'ticker', 'tickers']:
-                    symbol_col = i
-                    break
-            
-            if symbol_col is not None:
-                for row in reader:
-                    if len(row) > symbol_col:
-                        symbol = row[symbol_col].strip().upper()
-                        if symbol:
-                            symbols.append(symbol)
-            else:
-                # If no header found, assume first column contains symbols
-                for row in reader:
-                    if row:
-                        symbol = row[0].strip().upper()
-                        if symbol:
-                            symbols.append(symbol)
-        else:
-            # No header, assume first column contains symbols
-            for row in reader:
-                if row:
-                    symbol = row[0].strip().upper()
-                    if symbol:
-                        symbols.append(symbol)
-                        
-    except Exception as e:
-        # If CSV parsing fails, try simple line-by-line reading
-        lines = content.splitlines()
-        for line in lines:
-            symbol = line.strip().upper()
-            if symbol and not symbol.lower().startswith('symbol'):  # Skip if looks like header
-                symbols.append(symbol)
-    
-    return list(set(symbols))  # Remove duplicates
-
 @app.route("/")
 def dashboard():
-    try:
-        r = requests.get(f"{BASE_API_URL}/portfolio/accounts", verify=False)
-        accounts = r.json()
-    except Exception as e:
+    portfolio = aggregate_portfolio()
+    if not portfolio:
         return 'Make sure you authenticate first then visit this page. <a href="https://localhost:5055">Log in</a>'
 
-    account = accounts[0]
-    account_id = accounts[0]["id"]
-    r = requests.get(f"{BASE_API_URL}/portfolio/{account_id}/summary", verify=False)
-    summary = r.json()
-    
-    return render_template("dashboard.html", account=account, summary=summary)
+    return render_template("dashboard.html", portfolio=portfolio)
+
+@app.route("/portfolio/consolidated")
+def consolidated_portfolio():
+    portfolio = aggregate_portfolio()
+    if not portfolio:
+        return jsonify({"error": "Not authenticated"}), 401
+    return jsonify(portfolio)
 
 @app.route("/lookup")
 def lookup():
@@ -115,39 +150,68 @@ def lookup():
     stocks = []
 
     if symbol is not None:
-        r = requests.get(f"{BASE_API_URL}/iserver/secdef/search?symbol={symbol}&name=true", verify=False)
-        response = r.json()
-        stocks = response
+        stocks = search_symbol(symbol)
 
     return render_template("lookup.html", stocks=stocks)
 
 @app.route("/contract/<contract_id>/<period>")
 def contract(contract_id, period='5d', bar='1d'):
-    data = {
-        "conids": [
-            contract_id
-        ]
-    }
-    
-    r = requests.post(f"{BASE_API_URL}/trsrv/secdef", data=data, verify=False)
-    contract = r.json()['secdef'][0]
-
-    r = requests.get(f"{BASE_API_URL}/iserver/marketdata/history?conid={contract_id}&period={period}&bar={bar}", verify=False)
-    price_history = r.json()
-
-    return render_template("contract.html", price_history=price_history, contract=contract)
+    try:
+        duration_seconds(period)
+    except ValueError:
+        units = ", ".join(UNIT_SECONDS)
+        return f'Unsupported period "{escape(period)}". Use a number followed by one of {units}, e.g. 5d, 6m or 1y.', 400
+    contract, price_history, snapshot = load_contract_page(contract_id, period, bar)
+    if contract is None:
+        return f'Unable to load contract {contract_id}. Make sure you are authenticated. <a href="https://localhost:5055">Log in</a>'
+
+    # History is already in the local bar store, so this makes no gateway calls
+    analytics = analyse_contract(contract_id, period, bar)
+
+    return render_template("contract.html", price_history=price_history, contract=contract, snapshot=snapshot, analytics=analytics)
+
+@app.route("/contracts")
+def contracts_lookup():
+    """Batch contract definitions: /contracts?conids=265598,4815747"""
+    conids = [c.strip() for c in request.args.get("conids", "").split(",") if c.strip()]
+    if not conids:
+        return jsonify({"error": "Pass a comma-separated conids parameter"}), 400
+    return jsonify(get_contracts(conids))
+
+@app.route("/analytics/<contract_id>/<period>")
+def contract_analytics(contract_id, period):
+    bar = request.args.get("bar", "1d")
+    try:
+        return jsonify(analyse_contract(contract_id, period, bar))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/watchlists/<name>/analytics/<period>")
+def watchlist_analytics(name, period):
+    bar = request.args.get("bar", "1d")
+    watchlist = next((w for w in load_watchlists()["watchlists"] if w["name"] == name), None)
+    if watchlist is None:
+        return jsonify({"error": f"No watchlist named {name}"}), 404
+    try:
+        return jsonify(analyse_many([i["conid"] for i in watchlist["instruments"]], period, bar))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 @app.route("/orders")
 def orders():
-    try:
-        r = requests.get(f"{BASE_API_URL}/iserver/account/orders", verify=False)
-        if r.status_code == 200:
-            orders = r.json().get("orders", [])
-        else:
-            orders = []
-    except Exception as e:
-        orders = []
-    return render_template("orders.html", orders=orders)
+    # The tracker keeps the order table current; without it refresh inline
+    if not tracker_running():
+        try:
+            refresh_orders()
+        except Exception as e:
+            metrics.error("orders", e, "Error refreshing orders")
+    orders, version = get_orders()
+    return render_template("orders.html", orders=orders, version=version)
+
+@app.route("/orders/stream")
+def order_stream():
+    """Server-sent order rows that changed after ?since=<version>"""
+    return event_stream(order_events(request.args.get("since", 0, type=int)))
 
 @app.route("/order", methods=['POST'])
 def place_order():
@@ -169,9 +233,41 @@ def place_order():
         ]
     }
 
-    r = requests.post(f"{BASE_API_URL}/iserver/account/{account_id}/orders", json=data, verify=False)
+    r = gateway.post(f"/iserver/account/{account_id}/orders", json=data)
+    request_refresh()
     return redirect("/orders")
 
+@app.route("/orders/basket", methods=["POST"])
+def place_basket():
+    """Submit many orders from JSON {"orders": [...], "confirm": true, "dry_run": false} or a CSV upload/body"""
+    account_id = get_account_id()
+    if not account_id:
+        return jsonify({"error": "Unable to determine account ID"}), 401
+
+    confirm = request.args.get("confirm", "1") != "0"
+    dry_run = request.args.get("dry_run", "0") == "1"
+    if request.is_json:
+        body = request.get_json(silent=True)
+        orders = body.get("orders") if isinstance(body, dict) else body
+        if isinstance(body, dict):
+            confirm = bool(body.get("confirm", confirm))
+            dry_run = bool(body.get("dry_run", dry_run))
+    elif 'file' in request.files:
+        orders = read_csv_orders(request.files['file'].stream)
+    else:
+        orders = read_csv_orders(io.StringIO(request.get_data(as_text=True)))
+
+    if not isinstance(orders, list) or not orders:
+        return jsonify({"error": "Expected a JSON list of orders, {\"orders\": [...]} or a CSV with a header row"}), 400
+    try:
+        result = submit_basket(account_id, orders, confirm=confirm, dry_run=dry_run)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if result["submitted"] or result["unknown"]:
+        request_refresh()
+    return jsonify(dict(result, account_id=account_id))
+
 @app.route("/orders/<order_id>/cancel")
 def cancel_order(order_id):
     account_id = get_account_id()
@@ -179,9 +275,15 @@ def cancel_order(order_id):
         flash("Unable to determine account ID", "error")
         return redirect("/orders")
 
-    cancel_url = f"{BASE_API_URL}/iserver/account/{account_id}/order/{order_id}" 
-    r = requests.delete(cancel_url, verify=False)
-    return r.json()
+    r = gateway.delete(f"/iserver/account/{account_id}/order/{order_id}")
+    result = r.json() if r.content else {}
+    if r.status_code == 200 and "error" not in result:
+        update_order(order_id, status="PendingCancel")
+        flash(result.get("msg", f"Cancel requested for order {order_id}"), "success")
+    else:
+        flash(f"Unable to cancel order {order_id}: {result.get('error', r.status_code)}", "error")
+    request_refresh()
+    return redirect("/orders")
 
 @app.route("/portfolio")
 def portfolio():
@@ -195,25 +297,14 @@ def portfolio():
         return render_template("portfolio.html", positions=[], auth_error=True)
 
     try:
-        # Get positions with retry logic
-        for _ in range(3):  # Try up to 3 times
-            positions_response = requests.get(f"{BASE_API_URL}/portfolio/{account_id}/positions/0", verify=False)
-            
-            if positions_response.status_code == 200 and positions_response.content:
-                try:
-                    positions = positions_response.json()
-                    if isinstance(positions, list):
-                        if not positions:
-                            flash("No positions found in your portfolio", "info")
-                        return render_template("portfolio.html", positions=positions, auth_error=False)
-                except ValueError:
-                    time.sleep(1)  # Wait before retry
-                    continue
-            
-            time.sleep(1)  # Wait before retry
+        result = get_positions(account_id)
+        if result is None:
+            flash("Error fetching positions. Please try again.", "error")
+            return render_template("portfolio.html", positions=[], auth_error=False)
 
-        flash("Error fetching positions. Please try again.", "error")
-        return render_template("portfolio.html", positions=[], auth_error=False)
+        if not result["positions"]:
+            flash("No positions found in your portfolio", "info")
+        return render_template("portfolio.html", positions=result["positions"], pages=result["pages"], auth_error=False)
 
     except requests.exceptions.RequestException as e:
         flash(f"Error connecting to Interactive Brokers API: {str(e)}", "error")
@@ -221,35 +312,7 @@ def portfolio():
 
 @app.route("/scanner")
 def scanner():
-    r = requests.get(f"{BASE_API_URL}/iserver/scanner/params", verify=False)
-    params = r.json()
-
-    scanner_map = {}
-    filter_map = {}
-
-    for item in params['instrument_list']:
-        scanner_map[item['type']] = {
-            "display_name": item['display_name'],
-            "filters": item['filters'],
-            "sorts": []
-        }
-
-    for item in params['filter_list']:
-        filter_map[item['group']] = {
-            "display_name": item['display_name'],
-            "type": item['type'],
-            "code": item['code']
-        }
-
-    for item in params['scan_type_list']:
-        for instrument in item['instruments']:
-            scanner_map[instrument]['sorts'].append({
-                "name": item['display_name'],
-                "code": item['code']
-            })
-
-    for item in params['location_tree']:
-        scanner_map[item['type']]['locations'] = item['locations']
+    catalog = get_catalog()
 
     submitted = request.args.get("submitted", "")
     selected_instrument = request.args.get("instrument", "")
@@ -260,8 +323,7 @@ def scanner():
     filter_value = request.args.get("filter_value", "")
 
     if submitted:
-        print("submitting")
-        data = {
+        scan = run_scan({
             "instrument": selected_instrument,
             "location": location,
             "type": sort,
@@ -271,12 +333,32 @@ def scanner():
                     "value": filter_value
                 }
             ]
-        }
-            
-        r = requests.post(f"{BASE_API_URL}/iserver/scanner/run", json=data, verify=False)
-        scan_results = r.json()
-
-    return render_template("scanner.html", params=params, scanner_map=scanner_map, filter_map=filter_map, scan_results=scan_results)
+        })
+        scan_results = scan["results"]
+        if scan["error"]:
+            flash(f"Scan failed: {scan['error']}", "error")
+
+    return render_template("scanner.html", scanner_map=catalog["scanner_map"], catalog_version=catalog["etag"], scan_results=scan_results)
+
+@app.route("/scanner/catalog.js")
+def scanner_catalog_js():
+    catalog = get_catalog()
+    response = make_response(catalog["script"])
+    response.mimetype = "application/javascript"
+    response.set_etag(catalog["etag"])
+    # The URL carries the catalog version, so browsers can keep it until the catalog changes
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response.make_conditional(request)
+
+@app.route("/scanner/run", methods=["POST"])
+def run_scanner_batch():
+    """Run a list of scan definitions concurrently and return the merged contracts as JSON"""
+    body = request.get_json(silent=True)
+    definitions = body.get("scans", []) if isinstance(body, dict) else body
+    if not isinstance(definitions, list) or not definitions:
+        return jsonify({"error": "Expected a JSON list of scans or {\"scans\": [...]}"}), 400
+    return jsonify(run_scans(definitions))
 
 @app.route("/watchlists")
 def watchlists():
@@ -295,6 +377,12 @@ def watchlists():
         selected_watchlist=None
     )
 
+@app.route("/quotes/stream")
+def quote_stream():
+    """Server-sent quote updates: /quotes/stream?conids=265598,4815747 (default: every watchlist instrument)"""
+    conids = [c.strip() for c in request.args.get("conids", "").split(",") if c.strip()] or get_watchlist_conids()
+    return event_stream(quote_events(conids))
+
 @app.route("/watchlists/<name>")
 def view_watchlist(name):
     sort_by = request.args.get('sort_by')
@@ -325,8 +413,7 @@ def search_for_watchlist(watchlist_name):
     search_results = []
     
     if symbol:
-        r = requests.get(f"{BASE_API_URL}/iserver/secdef/search?symbol={symbol}&name=true", verify=False)
-        search_results = r.json()
+        search_results = search_symbol(symbol)
     
     watchlists = get_watchlists()
     selected = next((w for w in watchlists["watchlists"] if w["name"] == watchlist_name), None)
@@ -375,55 +462,23 @@ def upload_csv_watchlist(watchlist_name):
         return redirect(url_for('view_watchlist', name=watchlist_name))
     
     try:
-        # Read file content
-        content = file.stream.read().decode('UTF-8')
-        if not content.strip():
+        head = file.stream.read(1024)
+        file.stream.seek(0)
+        if not head.strip() and len(head) < 1024:
             flash('The uploaded file is empty', 'error')
             return redirect(url_for('view_watchlist', name=watchlist_name))
         
-        # Process CSV content
-        symbols = process_csv_content(content)
+        # Stream symbols straight from the upload
+        symbols = list(iter_csv_symbols(file.stream))
         
         if not symbols:
             flash('No valid symbols found in the file', 'error')
             return redirect(url_for('view_watchlist', name=watchlist_name))
         
-        successful_symbols = []
-        failed_symbols = []
+        successful_symbols, failed_symbols = resolve_symbols(symbols)
         
-        for symbol in symbols:
-            try:
-                # Search for the symbol
-                r = requests.get(f"{BASE_API_URL}/iserver/secdef/search?symbol={symbol}&name=true", verify=False)
-                results = r.json()
-                
-                if results and len(results) > 0:
-                    # Take the first match
-                    stock = results[0]
-                    successful_symbols.append({
-                        "symbol": stock['symbol'],
-                        "conid": stock['conid'],
-                        "company_name": stock.get('companyName', ''),
-                        "description": stock.get('description', '')
-                    })
-                else:
-                    failed_symbols.append({
-                        "symbol": symbol,
-                        "reason": "Symbol not found"
-                    })
-            except Exception as e:
-                failed_symbols.append({
-                    "symbol": symbol,
-                    "reason": str(e)
-                })
-                continue
-        
-        # Store in session for the staging page
-        session['staging_data'] = {
-            'watchlist_name': watchlist_name,
-            'successful_symbols': successful_symbols,
-            'failed_symbols': failed_symbols
-        }
+        # Stage server-side; the session only carries the upload ID
+        session['staging_upload_id'] = staging.create(watchlist_name, successful_symbols, failed_symbols)
         
         return redirect(url_for('stage_csv_upload', watchlist_name=watchlist_name))
             
@@ -433,42 +488,57 @@ def upload_csv_watchlist(watchlist_name):
 
 @app.route("/watchlists/<watchlist_name>/stage", methods=["GET"])
 def stage_csv_upload(watchlist_name):
-    staging_data = session.get('staging_data', {})
+    upload_id = session.get('staging_upload_id')
+    staging_data = staging.get(upload_id)
     
     if not staging_data or staging_data.get('watchlist_name') != watchlist_name:
         flash('No staging data found. Please upload a CSV file first.', 'error')
         return redirect(url_for('view_watchlist', name=watchlist_name))
     
-    watchlists = get_watchlists()
+    watchlists = load_watchlists()
     selected = next((w for w in watchlists["watchlists"] if w["name"] == watchlist_name), None)
     
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = staging.STAGING_PAGE_SIZE
+    total_rows = max(staging_data['successful_count'], staging_data['failed_count'])
+    
     return render_template(
         "watchlists_staging.html",
         watchlists=watchlists,
         selected_watchlist=selected,
-        successful_symbols=staging_data.get('successful_symbols', []),
-        failed_symbols=staging_data.get('failed_symbols', [])
+        successful_symbols=staging.get_page(upload_id, False, page, per_page),
+        failed_symbols=staging.get_page(upload_id, True, page, per_page),
+        successful_count=staging_data['successful_count'],
+        failed_count=staging_data['failed_count'],
+        page=page,
+        pages=max((total_rows + per_page - 1) // per_page, 1)
     )
 
 @app.route("/watchlists/<watchlist_name>/stage/confirm", methods=["POST"])
 def confirm_staged_symbols(watchlist_name):
-    staging_data = session.get('staging_data', {})
+    upload_id = session.get('staging_upload_id')
+    staging_data = staging.get(upload_id)
     
     if not staging_data or staging_data.get('watchlist_name') != watchlist_name:
         flash('No staging data found. Please upload a CSV file first.', 'error')
         return redirect(url_for('view_watchlist', name=watchlist_name))
     
-    selected_symbols = request.form.getlist('selected_symbols')
-    successful_symbols = staging_data.get('successful_symbols', [])
+    # Remember the ticks on the page that was just submitted
+    staging.set_selection(
+        upload_id,
+        request.form.getlist('shown_symbols'),
+        set(request.form.getlist('selected_symbols'))
+    )
+    
+    goto_page = request.form.get('goto_page', type=int)
+    if goto_page:
+        return redirect(url_for('stage_csv_upload', watchlist_name=watchlist_name, page=goto_page))
     
-    symbols_added = 0
-    for symbol_data in successful_symbols:
-        if str(symbol_data['conid']) in selected_symbols:
-            add_to_watchlist(watchlist_name, symbol_data)
-            symbols_added += 1
+    symbols_added = add_many_to_watchlist(watchlist_name, staging.selected_symbols(upload_id))
     
     # Clear staging data
-    session.pop('staging_data', None)
+    staging.discard(upload_id)
+    session.pop('staging_upload_id', None)
     
     flash(f'Successfully added {symbols_added} symbols to watchlist', 'success')
     return redirect(url_for('view_watchlist', name=watchlist_name))
\ No newline at end of file
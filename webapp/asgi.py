@@ -0,0 +1,16 @@
+"""
+ASGI entry point, run from webapp/ like the dev server:
+
+    uvicorn webapp.asgi:asgi_app --app-dir .. --host 0.0.0.0 --port 5056
+
+The app is plain WSGI with blocking gateway calls; a2wsgi runs each request on a thread
+from its pool, so this behaves like a threaded WSGI server behind uvicorn's HTTP handling.
+"""
+import os
+from a2wsgi import WSGIMiddleware
+from webapp.app import app
+
+# Requests, open event streams included, are handled on this many threads
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 64))
+
+asgi_app = WSGIMiddleware(app, workers=ASGI_THREADS)
@@ -0,0 +1,20 @@
+"""
+Production pre-fork server, run from webapp/ like the dev server: gunicorn -c gunicorn.conf.py webapp.app:app
+
+Workers share watchlists, staging, caches and quotes through the SQLite stores in
+webapp/data, and the session secret through FLASK_SECRET_KEY or webapp/data/secret_key.
+"""
+import multiprocessing
+import os
+
+# The app imports itself as the webapp package, so the repo root has to be importable
+pythonpath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+bind = f"0.0.0.0:{os.environ.get('PORT', 5056)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Threaded workers so slow gateway calls don't hold a whole process; up to
+# MAX_EVENT_STREAMS (16) of each worker's threads can be held by live quote and order streams
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+# The quote poller and executors are threads, so each worker must import the app itself
+preload_app = False
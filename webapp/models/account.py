@@ -0,0 +1,64 @@
+import os
+import threading
+import time
+from webapp.models import gateway, metrics
+
+ACCOUNT_ID = os.environ.get('IBKR_ACCOUNT_ID')
+ACCOUNT_CACHE_TTL = float(os.environ.get('ACCOUNT_CACHE_TTL', 60))
+
+_lock = threading.RLock()
+_cache = {"accounts": None, "authenticated": False, "expires": 0}
+
+def invalidate():
+    with _lock:
+        _cache["accounts"] = None
+        _cache["authenticated"] = False
+        _cache["expires"] = 0
+
+gateway.on_unauthorized(invalidate)
+
+def _fetch_accounts():
+    try:
+        r = gateway.get("/portfolio/accounts")
+        if r.status_code == 200 and r.content:
+            accounts = r.json()
+            if isinstance(accounts, list):
+                return accounts, True
+    except gateway.RateLimited:
+        raise
+    except Exception as e:
+        metrics.error("accounts", e, "Error fetching accounts")
+    return None, False
+
+def get_accounts(refresh=False):
+    """Return the cached /portfolio/accounts list, refreshing it once the TTL expires"""
+    with _lock:
+        if not refresh and time.monotonic() < _cache["expires"]:
+            metrics.cache_result("accounts", True)
+            return _cache["accounts"]
+        metrics.cache_result("accounts", False)
+
+        # Held while fetching so concurrent requests share one gateway call
+        try:
+            accounts, authenticated = _fetch_accounts()
+        except gateway.RateLimited:
+            # Keep serving the last answer until the pacing allows another call
+            _cache["expires"] = time.monotonic() + 1
+            return _cache["accounts"]
+        _cache["accounts"] = accounts
+        _cache["authenticated"] = authenticated
+        # Only cache failures briefly so a fresh login is picked up quickly
+        _cache["expires"] = time.monotonic() + (ACCOUNT_CACHE_TTL if authenticated else 1)
+        return accounts
+
+def check_auth():
+    """Check if user is authenticated with IBKR"""
+    get_accounts()
+    return _cache["authenticated"]
+
+def get_account_id():
+    """Get the first available account ID"""
+    accounts = get_accounts()
+    if accounts:
+        return accounts[0]['id']
+    return ACCOUNT_ID
@@ -0,0 +1,213 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from webapp.models import metrics
+from webapp.models.bars import duration_seconds, load_bar_rows, sync_history
+
+ANALYTICS_CACHE_TTL = float(os.environ.get('ANALYTICS_CACHE_TTL', 60))
+ANALYTICS_CACHE_SIZE = int(os.environ.get('ANALYTICS_CACHE_SIZE', 256))
+# Histories for a watchlist are synced concurrently; the gateway's history pacing still applies
+HISTORY_WORKERS = int(os.environ.get('HISTORY_WORKERS', 8))
+VOLATILITY_WINDOW = 20
+SMA_WINDOW = 20
+EMA_SPAN = 20
+ATR_WINDOW = 14
+
+_lock = threading.Lock()
+# key -> (computed at, result), oldest first
+_cache = {}
+_executor = ThreadPoolExecutor(max_workers=HISTORY_WORKERS, thread_name_prefix="history")
+
+# All indicators work on 1-D series or 2-D (time x instrument) arrays
+
+def simple_returns(close):
+    close = np.asarray(close, dtype=float)
+    out = np.full(close.shape, np.nan)
+    out[1:] = close[1:] / close[:-1] - 1
+    return out
+
+def rolling_mean(values, window):
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    if len(values) < window:
+        return out
+    cumsum = np.cumsum(np.insert(values, 0, 0, axis=0), axis=0)
+    out[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return out
+
+def rolling_std(values, window):
+    """Sample standard deviation over a trailing window, via running sums"""
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    if len(values) < window:
+        return out
+    mean = rolling_mean(values, window)
+    mean_sq = rolling_mean(values ** 2, window)
+    variance = np.maximum(mean_sq - mean ** 2, 0) * window / (window - 1)
+    out[window - 1:] = np.sqrt(variance[window - 1:])
+    return out
+
+def rolling_volatility(returns, window=VOLATILITY_WINDOW, periods_per_year=252):
+    """Annualized volatility of returns over a trailing window (the leading NaN return is skipped)"""
+    returns = np.asarray(returns, dtype=float)
+    out = np.full(returns.shape, np.nan)
+    out[1:] = rolling_std(returns[1:], window) * math.sqrt(periods_per_year)
+    return out
+
+def sma(close, window=SMA_WINDOW):
+    return rolling_mean(close, window)
+
+def ema(close, span=EMA_SPAN):
+    """Exponential moving average; the time loop is vectorized across instruments"""
+    close = np.asarray(close, dtype=float)
+    out = np.empty(close.shape)
+    if len(close) == 0:
+        return out
+    alpha = 2 / (span + 1)
+    out[0] = close[0]
+    for i in range(1, len(close)):
+        out[i] = alpha * close[i] + (1 - alpha) * out[i - 1]
+    return out
+
+def drawdown(close):
+    """Fractional distance below the running peak"""
+    close = np.asarray(close, dtype=float)
+    return close / np.maximum.accumulate(close, axis=0) - 1
+
+def atr(high, low, close, window=ATR_WINDOW):
+    """Average true range as a simple moving average of the true range"""
+    high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+    previous_close = np.concatenate([close[:1], close[:-1]], axis=0)
+    true_range = np.maximum.reduce([
+        high - low,
+        np.abs(high - previous_close),
+        np.abs(low - previous_close)
+    ])
+    return rolling_mean(true_range, window)
+
+def correlation_matrix(returns):
+    """Correlation of the columns of a (time x instrument) returns array, ignoring leading NaN rows"""
+    returns = np.asarray(returns, dtype=float)
+    returns = returns[~np.isnan(returns).any(axis=1)]
+    if returns.shape[0] < 2:
+        return np.full((returns.shape[1], returns.shape[1]), np.nan)
+    # corrcoef of a single column is a scalar
+    return np.atleast_2d(np.corrcoef(returns, rowvar=False))
+
+def periods_per_year(bar):
+    seconds = duration_seconds(bar)
+    if seconds >= 30 * 86400:
+        return 12
+    if seconds >= 7 * 86400:
+        return 52
+    if seconds >= 86400:
+        return 252
+    return 252 * 23400 / seconds  # 6.5 hour sessions
+
+def to_list(values):
+    """JSON-safe list with NaN as None"""
+    return [None if isinstance(v, float) and math.isnan(v) else v for v in np.asarray(values).tolist()]
+
+def load_arrays(conid, period, bar, max_wait=...):
+    """({"t", "o", "h", "l", "c", "v"} arrays, whether a history fetch failed, leaving stored bars missing or stale)"""
+    start_ms, _, failed = sync_history(conid, period, bar, max_wait)
+    rows = np.array(load_bar_rows(conid, bar, start_ms), dtype=float).reshape(-1, 6)
+    return dict(zip(("t", "o", "h", "l", "c", "v"), rows.T)), failed
+
+def _cached(key, compute):
+    now = time.time()
+    with _lock:
+        hit = _cache.get(key)
+        if hit and now - hit[0] < ANALYTICS_CACHE_TTL:
+            metrics.cache_result("analytics", True)
+            return hit[1]
+    metrics.cache_result("analytics", False)
+    result = compute()
+    if result.get("missing"):
+        # Incomplete results are recomputed on the next request instead of served for the TTL
+        return result
+    with _lock:
+        _cache.pop(key, None)
+        _cache[key] = (now, result)
+        while len(_cache) > ANALYTICS_CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+    return result
+
+def _indicators(bars, bar):
+    close = bars["c"]
+    returns = simple_returns(close)
+    per_year = periods_per_year(bar)
+    return {
+        "returns": returns,
+        "volatility": rolling_volatility(returns, periods_per_year=per_year),
+        "sma": sma(close),
+        "ema": ema(close),
+        "drawdown": drawdown(close),
+        "atr": atr(bars["h"], bars["l"], close)
+    }
+
+def _summary(bars, indicators, bar):
+    close = bars["c"]
+    last = lambda key: to_list(indicators[key][-1:])[0]
+    return {
+        "last": float(close[-1]),
+        "total_return": float(close[-1] / close[0] - 1),
+        "volatility": last("volatility"),
+        "annualized_volatility": float(np.std(indicators["returns"][1:], ddof=1) * math.sqrt(periods_per_year(bar))) if len(close) > 2 else None,
+        "max_drawdown": float(indicators["drawdown"].min()),
+        "sma": last("sma"),
+        "ema": last("ema"),
+        "atr": last("atr")
+    }
+
+def analyse_contract(conid, period='365d', bar='1d'):
+    """Indicator series and summary statistics for one contract, cached per (conid, bar, period)"""
+    def compute():
+        bars, failed = load_arrays(conid, period, bar)
+        result = {"conid": str(conid), "period": period, "bar": bar, "bars": len(bars["c"]), "series": {}, "summary": {},
+                  "missing": [str(conid)] if failed and not len(bars["c"]) else []}
+        if len(bars["c"]) == 0:
+            return result
+        indicators = _indicators(bars, bar)
+        result["series"] = dict(
+            {"t": to_list(bars["t"].astype(np.int64)), "close": to_list(bars["c"])},
+            **{key: to_list(values) for key, values in indicators.items()}
+        )
+        result["summary"] = _summary(bars, indicators, bar)
+        return result
+    return _cached(("contract", str(conid), bar, period), compute)
+
+def analyse_many(conids, period='365d', bar='1d'):
+    """Summaries for several contracts plus the correlation matrix of their returns on common timestamps.
+
+    Histories queue for the gateway's history pacing; conids whose history still couldn't be
+    fetched are listed under "missing" and left out of the summaries and matrix.
+    """
+    conids = [str(c) for c in dict.fromkeys(conids)]
+
+    def compute():
+        loaded = dict(zip(conids, _executor.map(metrics.bind(lambda conid: load_arrays(conid, period, bar, max_wait=None)), conids)))
+        missing = [conid for conid, (bars, failed) in loaded.items() if failed and not len(bars["c"])]
+        loaded = {conid: bars for conid, (bars, _) in loaded.items() if len(bars["c"])}
+        labels = list(loaded)
+        correlations = []
+        if labels:
+            common = loaded[labels[0]]["t"]
+            for bars in loaded.values():
+                common = np.intersect1d(common, bars["t"])
+            # (time x instrument) closes aligned on the shared timestamps
+            closes = np.column_stack([
+                bars["c"][np.searchsorted(bars["t"], common)] for bars in loaded.values()
+            ])
+            correlations = [to_list(row) for row in correlation_matrix(simple_returns(closes))]
+        return {
+            "period": period,
+            "bar": bar,
+            "summaries": {conid: _summary(bars, _indicators(bars, bar), bar) for conid, bars in loaded.items()},
+            "correlation": {"conids": labels, "matrix": correlations},
+            "missing": missing
+        }
+    return _cached(("many", tuple(conids), bar, period), compute)
@@ -0,0 +1,125 @@
+import math
+import os
+import re
+import time
+from webapp.models import gateway, metrics
+from webapp.models.db import connect
+
+BARS_DB = 'bars.db'
+# How long the newest bar is trusted before its tail is fetched again
+BAR_REFRESH_INTERVAL = float(os.environ.get('BAR_REFRESH_INTERVAL', 60))
+
+UNIT_SECONDS = {
+    "min": 60,
+    "h": 3600,
+    "d": 86400,
+    "w": 7 * 86400,
+    "m": 30 * 86400,
+    "y": 365 * 86400,
+}
+
+def duration_seconds(value):
+    """Seconds in a gateway period or bar size such as '5min', '1h', '365d' or '2y'"""
+    match = re.fullmatch(r"(\d+)\s*(min|h|d|w|m|y)", value.strip().lower())
+    if not match:
+        raise ValueError(f"Unsupported period or bar size: {value}")
+    return int(match.group(1)) * UNIT_SECONDS[match.group(2)]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bars (
+    conid TEXT NOT NULL,
+    bar TEXT NOT NULL,
+    t INTEGER NOT NULL,
+    o REAL, h REAL, l REAL, c REAL, v REAL,
+    PRIMARY KEY (conid, bar, t)
+) WITHOUT ROWID;
+-- start: earliest time (ms) fully fetched; fetched: when the tail was last refreshed
+CREATE TABLE IF NOT EXISTS coverage (
+    conid TEXT NOT NULL,
+    bar TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    fetched REAL NOT NULL,
+    PRIMARY KEY (conid, bar)
+);
+"""
+
+def _db():
+    return connect(BARS_DB, _SCHEMA)
+
+def fetch_history(conid, period, bar, max_wait=...):
+    try:
+        r = gateway.get("/iserver/marketdata/history", params={"conid": conid, "period": period, "bar": bar}, max_wait=max_wait)
+    except gateway.RateLimited:
+        # Whatever is already stored is served until the next request gets a slot
+        return None
+    if r.status_code != 200:
+        return None
+    history = r.json()
+    if not isinstance(history, dict) or "data" not in history:
+        return None
+    return history
+
+def store_bars(conid, bar, rows, start_ms):
+    conn = _db()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO bars (conid, bar, t, o, h, l, c, v) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(str(conid), bar, int(row["t"]), row.get("o"), row.get("h"), row.get("l"), row.get("c"), row.get("v"))
+             for row in rows]
+        )
+        conn.execute("""
+            INSERT INTO coverage (conid, bar, start, fetched) VALUES (?, ?, ?, ?)
+            ON CONFLICT (conid, bar) DO UPDATE SET start = MIN(start, excluded.start), fetched = excluded.fetched
+        """, (str(conid), bar, start_ms, time.time()))
+
+def load_bar_rows(conid, bar, start_ms):
+    """(t, o, h, l, c, v) tuples from start_ms onwards, oldest first"""
+    cursor = _db().execute(
+        "SELECT t, o, h, l, c, v FROM bars WHERE conid = ? AND bar = ? AND t >= ? ORDER BY t",
+        (str(conid), bar, start_ms)
+    )
+    cursor.row_factory = None
+    return cursor.fetchall()
+
+def load_bars(conid, bar, start_ms):
+    return [dict(zip(("t", "o", "h", "l", "c", "v"), row)) for row in load_bar_rows(conid, bar, start_ms)]
+
+def sync_history(conid, period='5d', bar='1d', max_wait=...):
+    """Bring the local store up to date for a period, fetching only what it is missing.
+
+    The first request for a (conid, bar) pulls the whole period; later requests only
+    fetch the tail since the newest stored bar, and not at all within BAR_REFRESH_INTERVAL.
+    Returns (start of the period in ms, number of gateway calls made, whether a needed fetch failed).
+    """
+    now = time.time()
+    start_ms = int((now - duration_seconds(period)) * 1000)
+    coverage = _db().execute(
+        "SELECT start, fetched FROM coverage WHERE conid = ? AND bar = ?", (str(conid), bar)
+    ).fetchone()
+    gateway_calls = 0
+    history = None
+
+    if coverage is None or coverage["start"] > start_ms:
+        history = fetch_history(conid, period, bar, max_wait)
+        gateway_calls += 1
+        if history is not None:
+            store_bars(conid, bar, history["data"], start_ms)
+    elif now - coverage["fetched"] > BAR_REFRESH_INTERVAL:
+        newest = _db().execute(
+            "SELECT MAX(t) FROM bars WHERE conid = ? AND bar = ?", (str(conid), bar)
+        ).fetchone()[0]
+        # Re-fetch from the newest stored bar, which may still have been forming
+        gap = now - (newest / 1000 if newest else coverage["start"] / 1000)
+        tail_days = max(1, math.ceil((gap + duration_seconds(bar)) / 86400))
+        history = fetch_history(conid, f"{tail_days}d", bar, max_wait)
+        gateway_calls += 1
+        if history is not None:
+            store_bars(conid, bar, history["data"], coverage["start"])
+
+    metrics.cache_result("bars", gateway_calls == 0)
+    return start_ms, gateway_calls, gateway_calls > 0 and history is None
+
+def get_history(conid, period='5d', bar='1d'):
+    """Return {"data": [bars]} for a period, served from the local store"""
+    start_ms, gateway_calls, _ = sync_history(conid, period, bar)
+    return {"data": load_bars(conid, bar, start_ms), "gateway_calls": gateway_calls}
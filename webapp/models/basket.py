@@ -0,0 +1,235 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from webapp.models import gateway, metrics
+from webapp.models.orders import fetch_orders
+from webapp.models.symbols import RESOLVE_WORKERS, resolve_symbol
+
+# Orders sent per /iserver/account/{id}/orders call
+BASKET_BATCH_SIZE = int(os.environ.get('BASKET_BATCH_SIZE', 20))
+BASKET_WORKERS = int(os.environ.get('BASKET_WORKERS', 4))
+# Confirmation rounds allowed per batch before giving up
+BASKET_MAX_REPLIES = int(os.environ.get('BASKET_MAX_REPLIES', 5))
+BASKET_MAX_ORDERS = int(os.environ.get('BASKET_MAX_ORDERS', 1000))
+
+ORDER_TYPES = ("LMT", "MKT", "STP", "STP_LMT")
+SIDES = ("BUY", "SELL")
+TIFS = ("DAY", "GTC", "IOC", "OPG")
+
+def read_csv_orders(stream):
+    """Order dicts from a CSV with a header row: conid or symbol, side, quantity, orderType, price, auxPrice, tif"""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    orders = []
+    for row in csv.DictReader(stream):
+        order = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+        if order:
+            orders.append(order)
+    return orders
+
+def _number(value, cast, name):
+    try:
+        number = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if number <= 0:
+        raise ValueError(f"{name} must be positive")
+    return number
+
+def basket_order_id(index, raw):
+    """A cOID derived from the row, its position and today's date.
+
+    The gateway requires cOIDs to be unique over 24 hours, so submitting the same basket
+    twice in a day gets the repeats rejected instead of placed again.
+    """
+    row = json.dumps([date.today().isoformat(), index, raw], sort_keys=True, default=str)
+    return f"basket-{hashlib.sha1(row.encode()).hexdigest()[:16]}"
+
+def validate_order(raw, index=0):
+    """Return the gateway order for one basket row, raising ValueError describing the first problem"""
+    order_type = str(raw.get("orderType", "LMT")).upper()
+    if order_type not in ORDER_TYPES:
+        raise ValueError(f"orderType must be one of {', '.join(ORDER_TYPES)}")
+    side = str(raw.get("side", "")).upper()
+    if side not in SIDES:
+        raise ValueError("side must be BUY or SELL")
+    tif = str(raw.get("tif", "GTC")).upper()
+    if tif not in TIFS:
+        raise ValueError(f"tif must be one of {', '.join(TIFS)}")
+    if not raw.get("conid") and not raw.get("symbol"):
+        raise ValueError("conid or symbol is required")
+
+    order = {
+        "orderType": order_type,
+        "side": side,
+        "tif": tif,
+        "quantity": _number(raw.get("quantity"), float, "quantity"),
+        "cOID": str(raw.get("cOID") or basket_order_id(index, raw))
+    }
+    if order["quantity"].is_integer():
+        order["quantity"] = int(order["quantity"])
+    if raw.get("conid"):
+        order["conid"] = int(_number(raw["conid"], int, "conid"))
+    else:
+        order["symbol"] = str(raw["symbol"]).strip().upper()
+    if order_type in ("LMT", "STP_LMT"):
+        order["price"] = _number(raw.get("price"), float, "price")
+    if order_type in ("STP", "STP_LMT"):
+        order["auxPrice"] = _number(raw.get("auxPrice"), float, "auxPrice")
+    return order
+
+def _resolve_conids(results):
+    """Fill in conids for orders given by symbol, searching each distinct symbol once"""
+    symbols = list(dict.fromkeys(r["order"]["symbol"] for r in results if r["order"] and "conid" not in r["order"]))
+    if not symbols:
+        return
+    with ThreadPoolExecutor(max_workers=RESOLVE_WORKERS) as executor:
+        resolved = {symbol: stock for symbol, (stock, _), _ in executor.map(metrics.bind(resolve_symbol), symbols)}
+    for result in results:
+        order = result["order"]
+        if order and "conid" not in order:
+            stock = resolved.get(order["symbol"])
+            if stock:
+                order["conid"] = int(stock["conid"])
+            else:
+                result.update(status="invalid", error=f"Symbol not found: {order['symbol']}")
+
+def _outcome(reply):
+    if "error" in reply:
+        return {"status": "rejected", "error": reply["error"]}
+    return {"status": "submitted", "order_id": reply.get("order_id"), "order_status": reply.get("order_status")}
+
+def _match_replies(batch, replies):
+    """{position in batch: outcome} for the replies that can be tied to an order.
+
+    Replies are matched on the cOID the gateway echoes back as local_order_id; replies
+    without one are only matched by position when there is exactly one per order.
+    """
+    positions = {result["order"]["cOID"]: position for position, result in enumerate(batch)}
+    matched = {}
+    for reply in replies:
+        position = positions.get(str(reply.get("local_order_id") or reply.get("cOID")))
+        if position is not None:
+            matched[position] = _outcome(reply)
+    if not matched and len(replies) == len(batch):
+        matched = {position: _outcome(reply) for position, reply in enumerate(replies)}
+    return matched
+
+def submit_batch(account_id, batch, confirm=True):
+    """Submit one orders array and follow its confirmation replies; fills in each result in place.
+
+    Orders that no reply accounts for are left "unknown" for reconcile() to look up; a batch
+    whose orders never left the app is "not_sent". Both calls queue for rate limit tokens, so
+    a batch is never left waiting at the gateway for a confirmation that was never sent.
+    """
+    started = time.perf_counter()
+    messages = []
+    replies = 0
+    reply_id = None
+    outcomes = {}
+    shared = None
+    try:
+        r = gateway.post(f"/iserver/account/{account_id}/orders", json={"orders": [result["order"] for result in batch]}, max_wait=None)
+        response = r.json()
+        # Warnings come back as [{"id": reply_id, "message": [...]}] and must be answered before the orders go in
+        while isinstance(response, list) and response and "id" in response[0] and "order_id" not in response[0]:
+            messages.extend(m for reply in response for m in reply.get("message", []))
+            reply_id = response[0]["id"]
+            if not confirm or replies >= BASKET_MAX_REPLIES:
+                shared = {"status": "needs_confirmation", "reply_id": reply_id}
+                break
+            replies += 1
+            r = gateway.post(f"/iserver/reply/{reply_id}", json={"confirmed": True}, max_wait=None)
+            response = r.json()
+        else:
+            if isinstance(response, dict):
+                response = [response]
+            if r.status_code != 200:
+                # The gateway validates the whole array before placing any of it
+                error = next((reply["error"] for reply in response if "error" in reply), f"HTTP {r.status_code}")
+                shared = {"status": "rejected", "error": error}
+            else:
+                outcomes = _match_replies(batch, response)
+    except gateway.RateLimited as e:
+        # Raised before the call goes out, so either nothing was sent or the batch is still waiting on this reply
+        if reply_id:
+            shared = {"status": "needs_confirmation", "reply_id": reply_id, "error": str(e)}
+        else:
+            shared = {"status": "not_sent", "error": str(e)}
+    except Exception as e:
+        shared = {"status": "unknown", "error": str(e)}
+
+    latency_ms = round((time.perf_counter() - started) * 1000, 1)
+    for position, result in enumerate(batch):
+        outcome = shared or outcomes.get(position) or {"status": "unknown", "error": "No matching reply from the gateway"}
+        result.update(outcome, messages=messages, replies=replies, latency_ms=latency_ms)
+
+def reconcile(results):
+    """Look unknown results up by cOID in the live order list, which the gateway reports as order_ref"""
+    unknown = [result for result in results if result["status"] == "unknown"]
+    if not unknown:
+        return
+    try:
+        # The orders endpoint allows one call per 5 seconds, so wait for the slot rather than leave orders unknown
+        orders = fetch_orders(max_wait=None) or []
+    except Exception as e:
+        metrics.error("basket", e, "Error reconciling basket orders")
+        return
+    live = {str(order.get("order_ref")): order for order in orders if order.get("order_ref")}
+    for result in unknown:
+        order = live.get(result["order"]["cOID"])
+        if order:
+            result.update(status="submitted", order_id=str(order.get("orderId")), order_status=order.get("status"), error=None)
+
+def submit_basket(account_id, orders, confirm=True, dry_run=False, batch_size=None):
+    """Validate a list of order dicts and submit the valid ones in concurrent batches.
+
+    Returns {"orders": [per-order result], "submitted", "failed", "not_sent", "unknown", "invalid", "batches",
+    "elapsed_ms"}; each result carries its input index, status, gateway order_id or error, and latency.
+    "not_sent" orders never reached the gateway and can be resubmitted; orders still "unknown" may
+    or may not have been placed and should be checked before resubmitting.
+    """
+    started = time.perf_counter()
+    orders = list(orders)
+    if len(orders) > BASKET_MAX_ORDERS:
+        raise ValueError(f"A basket can hold at most {BASKET_MAX_ORDERS} orders")
+
+    results = []
+    for index, raw in enumerate(orders):
+        result = {"index": index, "order": None, "status": "pending", "error": None}
+        try:
+            result["order"] = validate_order(raw if isinstance(raw, dict) else {}, index)
+        except ValueError as e:
+            result.update(status="invalid", error=str(e))
+        results.append(result)
+    _resolve_conids(results)
+    for result in results:
+        if result["order"]:
+            result["order"].pop("symbol", None)
+
+    valid = [result for result in results if result["status"] == "pending"]
+    batch_size = batch_size or BASKET_BATCH_SIZE
+    batches = [valid[start:start + batch_size] for start in range(0, len(valid), batch_size)]
+    if dry_run:
+        for result in valid:
+            result["status"] = "valid"
+    elif batches:
+        with ThreadPoolExecutor(max_workers=BASKET_WORKERS) as executor:
+            list(executor.map(metrics.bind(lambda batch: submit_batch(account_id, batch, confirm)), batches))
+        reconcile(valid)
+
+    return {
+        "orders": results,
+        "submitted": sum(1 for r in results if r["status"] == "submitted"),
+        "failed": sum(1 for r in results if r["status"] in ("rejected", "needs_confirmation")),
+        "not_sent": sum(1 for r in results if r["status"] == "not_sent"),
+        "unknown": sum(1 for r in results if r["status"] == "unknown"),
+        "invalid": sum(1 for r in results if r["status"] == "invalid"),
+        "batches": len(batches),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from webapp.models import gateway, metrics
+from webapp.models.bars import get_history
+from webapp.models.db import connect
+from webapp.models.quotes import get_quote, refresh_quotes
+
+CONTRACTS_DB = 'contracts.db'
+SECDEF_CACHE_TTL = float(os.environ.get('SECDEF_CACHE_TTL', 7 * 24 * 3600))
+SECDEF_BATCH_SIZE = int(os.environ.get('SECDEF_BATCH_SIZE', 100))
+
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('CONTRACT_WORKERS', 8)), thread_name_prefix="contract")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS secdef (
+    conid TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    fetched REAL NOT NULL
+);
+"""
+
+def _db():
+    return connect(CONTRACTS_DB, _SCHEMA)
+
+def get_contracts(conids):
+    """Return {conid: secdef} for many conids, fetching the uncached ones in batched /trsrv/secdef calls"""
+    conids = list(dict.fromkeys(str(c) for c in conids))
+    conn = _db()
+    contracts = {}
+    for start in range(0, len(conids), 500):
+        chunk = conids[start:start + 500]
+        rows = conn.execute(
+            f"SELECT conid, data FROM secdef WHERE fetched >= ? AND conid IN ({','.join('?' * len(chunk))})",
+            [time.time() - SECDEF_CACHE_TTL] + chunk
+        )
+        contracts.update({row["conid"]: json.loads(row["data"]) for row in rows})
+
+    missing = [c for c in conids if c not in contracts]
+    metrics.cache_result("secdef", "hit", len(contracts))
+    metrics.cache_result("secdef", "miss", len(missing))
+    for start in range(0, len(missing), SECDEF_BATCH_SIZE):
+        batch = missing[start:start + SECDEF_BATCH_SIZE]
+        # Batches queue for a slot rather than leaving later conids unresolved
+        r = gateway.post("/trsrv/secdef", json={"conids": [int(c) if c.isdigit() else c for c in batch]}, max_wait=None)
+        if r.status_code != 200:
+            continue
+        fetched = {str(secdef["conid"]): secdef for secdef in r.json().get("secdef", [])}
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO secdef (conid, data, fetched) VALUES (?, ?, ?)",
+                [(conid, json.dumps(secdef), time.time()) for conid, secdef in fetched.items()]
+            )
+        contracts.update(fetched)
+
+    return contracts
+
+def get_contract(conid):
+    return get_contracts([conid]).get(str(conid))
+
+def get_snapshot(conid):
+    refresh_quotes([conid])
+    return get_quote(conid)
+
+def load_contract_page(conid, period='5d', bar='1d'):
+    """Fetch contract definition, price history and a current snapshot concurrently"""
+    contract = _executor.submit(metrics.bind(get_contract), conid)
+    history = _executor.submit(metrics.bind(get_history), conid, period, bar)
+    snapshot = _executor.submit(metrics.bind(get_snapshot), conid)
+    return contract.result(), history.result(), snapshot.result()
@@ -0,0 +1,57 @@
+import csv
+import io
+import itertools
+
+SYMBOL_HEADERS = ['symbol', 'symbols', 'ticker', 'tickers']
+# Only this much of the upload is held in memory to detect the dialect and header
+SNIFF_CHARS = 64 * 1024
+
+def _text_stream(stream):
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    # utf-8-sig drops the BOM that Excel and some screeners write
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+def _normalized(values):
+    seen = set()
+    for value in values:
+        symbol = value.strip().upper()
+        if symbol and symbol not in seen:
+            seen.add(symbol)
+            yield symbol
+
+def iter_csv_symbols(stream):
+    """Yield unique, upper-cased symbols from a CSV stream in input order.
+
+    The dialect and header are sniffed from a bounded prefix and the rest of the
+    stream is read row by row, so memory doesn't grow with the file size.
+    """
+    text = _text_stream(stream)
+    prefix = text.read(SNIFF_CHARS)
+    if len(prefix) == SNIFF_CHARS:
+        prefix += text.readline()  # finish the row cut by the prefix
+    prefix = prefix.lstrip('\ufeff')
+    lines = itertools.chain(io.StringIO(prefix, newline=''), text)
+
+    try:
+        sniffer = csv.Sniffer()
+        dialect = sniffer.sniff(prefix)
+        has_header = sniffer.has_header(prefix)
+    except csv.Error:
+        # Not recognisable as CSV (e.g. a single column), read it line by line
+        yield from _normalized(
+            line for line in lines
+            if not line.strip().lower().startswith('symbol')  # Skip if looks like header
+        )
+        return
+
+    reader = csv.reader(lines, dialect)
+    symbol_col = 0
+    if has_header:
+        headers = next(reader, [])
+        for i, header in enumerate(headers):
+            if header.lower().strip() in SYMBOL_HEADERS:
+                symbol_col = i
+                break
+
+    yield from _normalized(row[symbol_col] for row in reader if len(row) > symbol_col)
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DATA_DIR = 'webapp/data'
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+# Databases whose schema this process has already created
+_schema_ready = set()
+
+def connect(name, schema=None):
+    """Return this thread's connection to DATA_DIR/<name>, opened in WAL mode.
+
+    schema is a script of CREATE ... IF NOT EXISTS statements, run once per process on first use.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    if name not in connections:
+        if not os.path.exists(DATA_DIR):
+            os.makedirs(DATA_DIR)
+        conn = sqlite3.connect(os.path.join(DATA_DIR, name), timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[name] = conn
+    if schema and name not in _schema_ready:
+        with _schema_lock:
+            if name not in _schema_ready:
+                connections[name].executescript(schema)
+                _schema_ready.add(name)
+    return connections[name]
+
+@contextmanager
+def write_transaction(conn):
+    """Transaction that takes the write lock up front, so read-then-write steps are safe across processes"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
@@ -0,0 +1,263 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+import requests
+from webapp.models import metrics
+from webapp.models.db import connect, write_transaction
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# disable warnings until you install a certificate
+import urllib3
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+BASE_API_URL = os.environ.get('IBKR_GATEWAY_URL', "https://localhost:5055/v1/api")
+VERIFY_SSL = os.environ.get('IBKR_GATEWAY_VERIFY', '0') == '1'
+POOL_SIZE = int(os.environ.get('IBKR_GATEWAY_POOL_SIZE', 20))
+RETRIES = int(os.environ.get('IBKR_GATEWAY_RETRIES', 2))
+BACKOFF = float(os.environ.get('IBKR_GATEWAY_BACKOFF', 0.3))
+DEFAULT_TIMEOUT = float(os.environ.get('IBKR_GATEWAY_TIMEOUT', 10))
+
+# (connect, read) timeouts by endpoint prefix, longest prefix wins
+TIMEOUTS = {
+    "/portfolio/accounts": (3, 5),
+    "/iserver/marketdata/snapshot": (3, 10),
+    "/iserver/marketdata/history": (3, 30),
+    "/iserver/secdef/search": (3, 10),
+    "/iserver/scanner": (3, 30),
+    "/iserver/account": (3, 15),
+}
+
+# Token buckets shared by every worker process and thread, so the gateway sees one budget per family
+RATE_LIMIT_DB = 'rate_limits.db'
+GATEWAY_RATE_LIMIT = float(os.environ.get('GATEWAY_RATE_LIMIT', 10))
+# Longest a call waits for a token before failing with RateLimited; batch callers and
+# background loops pass max_wait=None or call wait_for_tokens() to queue instead
+GATEWAY_MAX_RATE_WAIT = float(os.environ.get('GATEWAY_MAX_RATE_WAIT', 2))
+# Buckets refill at this fraction of the configured rates; pacing at exactly the gateway's
+# own limit gets calls whose delivery jitters a few ms early refused with 429
+GATEWAY_RATE_HEADROOM = float(os.environ.get('GATEWAY_RATE_HEADROOM', 0.9))
+
+# (requests per second, burst) by endpoint family, longest prefix wins, after the Client Portal pacing limits
+RATE_LIMITS = {
+    "/iserver/marketdata/snapshot": (float(os.environ.get('SNAPSHOT_RATE_LIMIT', 10)), 10),
+    "/iserver/marketdata/history": (float(os.environ.get('HISTORY_RATE_LIMIT', 5)), 5),
+    "/iserver/secdef/search": (float(os.environ.get('SYMBOL_SEARCH_RATE_LIMIT', 10)), 10),
+    "/iserver/scanner/run": (float(os.environ.get('SCAN_RATE_LIMIT', 1)), 1),
+    "/iserver/account/orders": (0.2, 1),
+    "/portfolio/accounts": (0.2, 1),
+    "/iserver/reply": (float(os.environ.get('ORDER_REPLY_RATE_LIMIT', 5)), 5),
+}
+
+RETRY_STATUSES = (429, 502, 503, 504)
+# Other methods, order POSTs included, are only replayed after a 429, which the gateway sends without acting on the call
+RETRY_METHODS = ("GET", "HEAD", "DELETE")
+
+# Identical in-flight requests to these share one gateway call; GETs always do
+COALESCE_POSTS = ("/trsrv/secdef", "/iserver/scanner/run")
+
+def build_session(pool_size=POOL_SIZE, retries=RETRIES, backoff=BACKOFF):
+    """Create a keep-alive session with a connection pool and retry policy.
+
+    The session only retries connection failures, which never reached the gateway;
+    status retries are made by _send so that each attempt is paced like a new call.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=0,
+        other=0,
+        backoff_factor=backoff,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.verify = VERIFY_SSL
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+session = build_session()
+
+# Callbacks run whenever the gateway answers 401 (session expired / logged out)
+unauthorized_listeners = []
+
+def on_unauthorized(callback):
+    unauthorized_listeners.append(callback)
+    return callback
+
+class RateLimited(requests.exceptions.RequestException):
+    """Raised before anything is sent when a call would wait longer than its max_wait for a rate limit token"""
+
+_RATE_LIMIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second with bursts of up to `burst`.
+
+    The bucket lives in RATE_LIMIT_DB, so every process draws from the same one.
+    """
+
+    def __init__(self, name, rate, burst=None):
+        self.name = name
+        self.rate = float(rate) * GATEWAY_RATE_HEADROOM
+        self.capacity = float(burst or rate)
+
+    def _reserve(self, conn, now):
+        """Refill the bucket and take a token, which may leave it negative; returns the seconds until that token is due"""
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+        tokens = self.capacity if row is None else min(self.capacity, row["tokens"] + (now - row["updated"]) * self.rate)
+        return tokens - 1, max(0, (1 - tokens) / self.rate)
+
+def acquire(limiters, max_wait=None):
+    """Reserve a token from each limiter and sleep until they are all due; returns the seconds waited.
+
+    Reservations queue callers in arrival order across processes. Raises RateLimited,
+    reserving nothing, if the wait would exceed max_wait seconds.
+    """
+    conn = connect(RATE_LIMIT_DB, _RATE_LIMIT_SCHEMA)
+    with write_transaction(conn):
+        now = time.time()
+        reserved = [(limiter, *limiter._reserve(conn, now)) for limiter in limiters]
+        wait = max((due for _, _, due in reserved), default=0)
+        if max_wait is not None and wait > max_wait:
+            raise RateLimited(f"Rate limited: next slot in {wait:.1f}s")
+        conn.executemany(
+            "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+            [(limiter.name, tokens, now) for limiter, tokens, _ in reserved]
+        )
+    if wait:
+        time.sleep(wait)
+    return wait
+
+global_limiter = RateLimiter("*", GATEWAY_RATE_LIMIT, max(1, GATEWAY_RATE_LIMIT))
+limiters = {prefix: RateLimiter(prefix, rate, burst) for prefix, (rate, burst) in RATE_LIMITS.items()}
+
+_max_wait = contextvars.ContextVar("gateway_max_wait", default=GATEWAY_MAX_RATE_WAIT)
+
+def wait_for_tokens():
+    """Make every call from the calling thread queue for rate limit tokens instead of raising RateLimited"""
+    _max_wait.set(None)
+
+_inflight_lock = threading.Lock()
+_inflight = {}
+
+def _longest_prefix(table, path):
+    matches = [prefix for prefix in table if path.startswith(prefix)]
+    return max(matches, key=len) if matches else None
+
+def timeout_for(path):
+    prefix = _longest_prefix(TIMEOUTS, path)
+    return TIMEOUTS[prefix] if prefix else DEFAULT_TIMEOUT
+
+def limiter_for(path):
+    prefix = _longest_prefix(limiters, path)
+    return limiters[prefix] if prefix else None
+
+def _retry_delay(r, attempt):
+    try:
+        return float(r.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return BACKOFF * 2 ** attempt
+
+def _coalesce_key(method, path, kwargs):
+    if method != "GET" and not (method == "POST" and path.startswith(COALESCE_POSTS)):
+        return None
+    return json.dumps([method, path, kwargs.get("params"), kwargs.get("json"), kwargs.get("data")], sort_keys=True, default=str)
+
+def endpoint_label(path):
+    """Path with account ids, conids and order/reply ids folded, for metric labels"""
+    return re.sub(r"/(?:[A-Z]{1,3}\d+|\d+|r?[0-9a-f]{8,}[0-9a-f-]*)(?=/|$)", "/{id}", path.split("?", 1)[0])
+
+def _send(method, path, max_wait, **kwargs):
+    endpoint = endpoint_label(path)
+    kwargs.setdefault("timeout", timeout_for(path))
+    family = limiter_for(path)
+    for attempt in range(RETRIES + 1):
+        try:
+            waited = acquire([family, global_limiter] if family else [global_limiter], max_wait)
+        except RateLimited:
+            metrics.inc("gateway_rate_limited_total", endpoint=endpoint)
+            raise
+        metrics.observe("gateway_rate_limit_wait_seconds", waited, endpoint=endpoint)
+        started = time.perf_counter()
+        try:
+            r = session.request(method, f"{BASE_API_URL}{path}", **kwargs)
+        except Exception as e:
+            metrics.inc("gateway_errors_total", endpoint=endpoint, method=method, error=type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.observe("gateway_request_duration_seconds", elapsed, endpoint=endpoint, method=method)
+            metrics.record_gateway_call(endpoint, elapsed)
+        metrics.inc("gateway_requests_total", endpoint=endpoint, method=method, status=r.status_code)
+        connect_retries = getattr(getattr(r.raw, "retries", None), "history", ())
+        if connect_retries:
+            metrics.inc("gateway_retries_total", len(connect_retries), endpoint=endpoint)
+        retryable = r.status_code == 429 or (r.status_code in RETRY_STATUSES and method in RETRY_METHODS)
+        if not retryable or attempt == RETRIES:
+            break
+        delay = _retry_delay(r, attempt)
+        if max_wait is not None and delay > max_wait:
+            break
+        metrics.inc("gateway_retries_total", endpoint=endpoint)
+        time.sleep(delay)
+    if r.status_code == 401:
+        for callback in unauthorized_listeners:
+            callback()
+    return r
+
+def request(method, path, max_wait=..., **kwargs):
+    """Send a request to the Client Portal gateway through the shared session.
+
+    Calls are paced by the global and per-family token buckets shared by all processes.
+    A call that would wait longer than max_wait seconds for a token (default
+    GATEWAY_MAX_RATE_WAIT, None to always wait) raises RateLimited without being sent.
+    While an identical read is already in flight, callers wait for it and share its response.
+    """
+    if max_wait is ...:
+        max_wait = _max_wait.get()
+    key = _coalesce_key(method, path, kwargs)
+    if key is None:
+        return _send(method, path, max_wait, **kwargs)
+
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[key] = {"done": threading.Event(), "response": None, "error": None}
+    if not leader:
+        metrics.inc("gateway_coalesced_total", endpoint=endpoint_label(path))
+        flight["done"].wait()
+        if flight["error"] is not None:
+            raise flight["error"]
+        return flight["response"]
+
+    try:
+        flight["response"] = _send(method, path, max_wait, **kwargs)
+        return flight["response"]
+    except Exception as e:
+        flight["error"] = e
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        flight["done"].set()
+
+def get(path, **kwargs):
+    return request("GET", path, **kwargs)
+
+def post(path, **kwargs):
+    return request("POST", path, **kwargs)
+
+def delete(path, **kwargs):
+    return request("DELETE", path, **kwargs)
@@ -0,0 +1,147 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+
+# Latency histogram buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# "0" off, "1" for requests carrying ?profile=1, "all" for every request
+REQUEST_PROFILING = os.environ.get('REQUEST_PROFILING', '0')
+
+# name -> (type, help)
+METRICS = {
+    "http_request_duration_seconds": ("histogram", "Flask request latency by route"),
+    "http_requests_total": ("counter", "Flask requests by route, method and status"),
+    "gateway_request_duration_seconds": ("histogram", "Client Portal gateway call latency by endpoint"),
+    "gateway_requests_total": ("counter", "Gateway calls by endpoint, method and status"),
+    "gateway_errors_total": ("counter", "Gateway calls that raised, by endpoint and exception"),
+    "gateway_retries_total": ("counter", "Gateway calls retried after a connection failure or retryable status, by endpoint"),
+    "gateway_coalesced_total": ("counter", "Gateway reads answered by an identical in-flight call"),
+    "gateway_rate_limit_wait_seconds": ("histogram", "Time spent waiting on the rate limiters, by endpoint"),
+    "gateway_rate_limited_total": ("counter", "Calls refused by the rate limiters because the wait exceeded their max_wait, by endpoint"),
+    "snapshot_batch_duration_seconds": ("histogram", "Time to fetch one multi-conid snapshot batch, including pacing and retries"),
+    "snapshot_batch_conids_total": ("counter", "Conids requested through snapshot batches"),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit, stale or miss)"),
+    "errors_total": ("counter", "Errors caught and logged by background and request code, by component"),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_profile = contextvars.ContextVar("profile", default=None)
+logger = logging.getLogger(__name__)
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def inc(name, amount=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name, seconds, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        for position, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram["buckets"][position] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+def cache_result(cache, result, amount=1):
+    """Count a cache lookup; result is "hit", "stale" or "miss" (or a bool for hit/miss)"""
+    if isinstance(result, bool):
+        result = "hit" if result else "miss"
+    if amount:
+        inc("cache_requests_total", amount, cache=cache, result=result)
+
+def error(component, exception, message=None):
+    """Record a caught error so it shows up in /metrics, and log it"""
+    inc("errors_total", component=component, type=type(exception).__name__)
+    logger.error("%s: %s", message or component + " error", exception)
+
+def _format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: dict(value, buckets=list(value["buckets"])) for key, value in _histograms.items()}
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            continue
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', str(bound))])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {round(histogram['sum'], 6)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+# Per-request profiling: gateway calls and template rendering add their time to the active profile
+
+def profiling_requested(args):
+    return REQUEST_PROFILING == "all" or (REQUEST_PROFILING == "1" and args.get("profile") == "1")
+
+def start_profile(enabled=True):
+    """Make a new profile (or None when not profiling) the active one; returns (profile, token for end_profile)"""
+    profile = {"started": time.perf_counter(), "gateway": [], "render": 0.0, "lock": threading.Lock()} if enabled else None
+    return profile, _profile.set(profile)
+
+def end_profile(token):
+    """Restore whatever profile was active before start_profile, so the thread doesn't keep reporting into this one"""
+    _profile.reset(token)
+
+def record_gateway_call(endpoint, seconds):
+    profile = _profile.get()
+    if profile is not None:
+        with profile["lock"]:
+            profile["gateway"].append((endpoint, seconds))
+
+def record_render(seconds):
+    profile = _profile.get()
+    if profile is not None:
+        profile["render"] += seconds
+
+def bind(func):
+    """Wrap func to run in the caller's context, so pool threads report into the caller's request profile"""
+    context = contextvars.copy_context()
+    # A context can only be entered by one thread at a time, so each call runs in its own copy
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+def summarize_profile(profile):
+    """(Server-Timing header value, log line) for a finished request"""
+    total = time.perf_counter() - profile["started"]
+    gateway_calls = profile["gateway"]
+    # Calls run concurrently, so their summed time can exceed the request's wall time
+    gateway_time = sum(seconds for _, seconds in gateway_calls)
+    by_endpoint = {}
+    for endpoint, seconds in gateway_calls:
+        count, spent = by_endpoint.get(endpoint, (0, 0.0))
+        by_endpoint[endpoint] = (count + 1, spent + seconds)
+    header = (
+        f'gateway;dur={gateway_time * 1000:.1f};desc="{len(gateway_calls)} calls", '
+        f'render;dur={profile["render"] * 1000:.1f}, total;dur={total * 1000:.1f}'
+    )
+    breakdown = ", ".join(f"{endpoint} x{count} {spent * 1000:.1f}ms" for endpoint, (count, spent) in by_endpoint.items())
+    return header, (
+        f"total {total * 1000:.1f}ms, render {profile['render'] * 1000:.1f}ms, "
+        f"gateway {gateway_time * 1000:.1f}ms in {len(gateway_calls)} calls" + (f" ({breakdown})" if breakdown else "")
+    )
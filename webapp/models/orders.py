@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+from webapp.models import gateway, metrics, shared_cache
+from webapp.models.db import DATA_DIR, connect, write_transaction
+from webapp.models.quotes import acquire_leadership
+
+ORDERS_DB = 'orders.db'
+# The gateway allows one /iserver/account/orders call per 5 seconds
+ORDER_POLL_INTERVAL = float(os.environ.get('ORDER_POLL_INTERVAL', 5))
+# How often an SSE client is checked for changed rows
+ORDER_PUSH_INTERVAL = float(os.environ.get('ORDER_PUSH_INTERVAL', 1))
+ORDER_KEEPALIVE_INTERVAL = float(os.environ.get('ORDER_KEEPALIVE_INTERVAL', 15))
+# Rows for orders the gateway stopped listing are kept this long as removal markers for connected clients
+ORDER_REMOVED_RETENTION = float(os.environ.get('ORDER_REMOVED_RETENTION', 3600))
+# Held by whichever worker process is currently polling
+ORDER_TRACKER_LOCK = os.path.join(DATA_DIR, 'order_tracker.lock')
+
+_tracker = {"thread": None, "stop": None}
+
+_SCHEMA = """
+-- version increases every time a row changes, so clients can ask for everything after the last one they saw
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_version ON orders (version);
+-- the last version handed out, kept apart from the rows so purging markers never lets a version be reused
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+def _db():
+    return connect(ORDERS_DB, _SCHEMA)
+
+def _last_version(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if row is not None:
+        return row["value"]
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM orders").fetchone()[0]
+
+def _save_version(conn, version):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+
+def fetch_orders(max_wait=...):
+    """The gateway's live order list, or None if it couldn't be loaded; max_wait is passed to gateway.get"""
+    try:
+        r = gateway.get("/iserver/account/orders", max_wait=max_wait)
+        if r.status_code == 200 and r.content:
+            orders = r.json().get("orders")
+            if isinstance(orders, list):
+                return orders
+    except (ValueError, gateway.RateLimited):
+        pass
+    return None
+
+def store_orders(orders, complete=False):
+    """Upsert orders by orderId, bumping the version of rows whose contents changed; returns how many did.
+
+    When orders is the gateway's complete list, rows it no longer contains are replaced by
+    {"orderId", "removed": true} markers, so clients drop them, and purged after ORDER_REMOVED_RETENTION.
+    """
+    conn = _db()
+    with write_transaction(conn):
+        version = _last_version(conn)
+        existing = {row["order_id"]: row["data"] for row in conn.execute("SELECT order_id, data FROM orders")}
+        changed = []
+        for order in orders:
+            order_id = str(order.get("orderId"))
+            data = json.dumps(order, sort_keys=True)
+            if existing.get(order_id) != data:
+                version += 1
+                changed.append((order_id, data, version, time.time()))
+        if complete:
+            listed = {str(order.get("orderId")) for order in orders}
+            for order_id, data in existing.items():
+                if order_id not in listed and not json.loads(data).get("removed"):
+                    version += 1
+                    changed.append((order_id, json.dumps({"orderId": order_id, "removed": True}), version, time.time()))
+            conn.execute(
+                "DELETE FROM orders WHERE json_extract(data, '$.removed') AND updated < ?",
+                (time.time() - ORDER_REMOVED_RETENTION,)
+            )
+        conn.executemany(
+            "INSERT OR REPLACE INTO orders (order_id, data, version, updated) VALUES (?, ?, ?, ?)",
+            changed
+        )
+        if changed:
+            _save_version(conn, version)
+    return len(changed)
+
+def update_order(order_id, **fields):
+    """Change fields of a tracked order locally, e.g. after a cancel, ahead of the next poll"""
+    conn = _db()
+    with write_transaction(conn):
+        row = conn.execute("SELECT data FROM orders WHERE order_id = ?", (str(order_id),)).fetchone()
+        if row is None:
+            return
+        version = _last_version(conn) + 1
+        conn.execute(
+            "UPDATE orders SET data = ?, version = ?, updated = ? WHERE order_id = ?",
+            (json.dumps(dict(json.loads(row["data"]), **fields), sort_keys=True), version, time.time(), str(order_id))
+        )
+        _save_version(conn, version)
+
+def refresh_orders():
+    orders = fetch_orders()
+    if orders is None:
+        return None
+    return store_orders(orders, complete=True)
+
+def get_orders(since=0):
+    """(orders changed after version `since`, newest first, and the version they bring the caller up to).
+
+    Removal markers are only returned to callers that already have rows, i.e. since > 0.
+    """
+    rows = _db().execute(
+        "SELECT data, version FROM orders WHERE version > ? ORDER BY CAST(order_id AS INTEGER) DESC",
+        (since,)
+    ).fetchall()
+    orders = [json.loads(row["data"]) for row in rows]
+    if not since:
+        orders = [order for order in orders if not order.get("removed")]
+    return orders, max((row["version"] for row in rows), default=since)
+
+def request_refresh():
+    """Ask the tracker, in whichever process runs it, to poll now rather than at the next interval"""
+    shared_cache.put("orders:refresh", time.time())
+
+def _track(stop):
+    gateway.wait_for_tokens()
+    leadership = None
+    last_poll = 0
+    while not stop.is_set():
+        if leadership is None:
+            leadership = acquire_leadership(ORDER_TRACKER_LOCK)
+            if leadership is None:
+                stop.wait(ORDER_POLL_INTERVAL)
+                continue
+        requested = shared_cache.get("orders:refresh") or 0
+        if time.time() - last_poll >= ORDER_POLL_INTERVAL or requested > last_poll:
+            last_poll = time.time()
+            try:
+                refresh_orders()
+            except Exception as e:
+                metrics.error("order_tracker", e, "Order tracker error")
+        stop.wait(0.5)
+    if leadership is not None:
+        leadership.close()
+
+def start_tracker():
+    """Keep the order table in step with the gateway from a background thread"""
+    if tracker_running():
+        return _tracker["thread"]
+    stop = threading.Event()
+    thread = threading.Thread(target=_track, args=(stop,), name="order-tracker", daemon=True)
+    _tracker["thread"], _tracker["stop"] = thread, stop
+    thread.start()
+    return thread
+
+def stop_tracker():
+    if _tracker["stop"]:
+        _tracker["stop"].set()
+    _tracker["thread"] = None
+
+def tracker_running():
+    return _tracker["thread"] is not None and _tracker["thread"].is_alive()
+
+def order_events(since=0):
+    """Server-sent events carrying only the order rows that changed since version `since`"""
+    last_event = time.monotonic()
+    while True:
+        orders, version = get_orders(since)
+        if orders:
+            since = version
+            last_event = time.monotonic()
+            yield f"event: orders\ndata: {json.dumps({'version': version, 'orders': orders})}\n\n"
+        elif time.monotonic() - last_event >= ORDER_KEEPALIVE_INTERVAL:
+            last_event = time.monotonic()
+            yield ": keep-alive\n\n"
+        time.sleep(ORDER_PUSH_INTERVAL)
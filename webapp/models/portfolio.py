@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from webapp.models import gateway, metrics, shared_cache
+from webapp.models.account import get_accounts
+
+POSITIONS_CACHE_TTL = float(os.environ.get('POSITIONS_CACHE_TTL', 15))
+# Stale results are served while a background refresh runs, up to this age
+POSITIONS_MAX_STALE = float(os.environ.get('POSITIONS_MAX_STALE', 300))
+POSITION_PAGE_WORKERS = int(os.environ.get('POSITION_PAGE_WORKERS', 4))
+# Shared by every account's page windows
+POSITION_PAGE_POOL = int(os.environ.get('POSITION_PAGE_POOL', 16))
+POSITION_PAGE_RETRIES = int(os.environ.get('POSITION_PAGE_RETRIES', 3))
+POSITION_PAGE_BACKOFF = float(os.environ.get('POSITION_PAGE_BACKOFF', 0.25))
+ACCOUNT_WORKERS = int(os.environ.get('ACCOUNT_WORKERS', 8))
+
+# Loaded positions are kept in the shared cache as "positions:<account>" so every worker can serve them
+_lock = threading.Lock()
+_refreshing = set()
+_executor = ThreadPoolExecutor(max_workers=POSITION_PAGE_POOL, thread_name_prefix="positions")
+# Separate pool so account tasks never wait on page tasks queued behind them
+_account_executor = ThreadPoolExecutor(max_workers=ACCOUNT_WORKERS, thread_name_prefix="accounts")
+
+def fetch_page(account_id, page):
+    """Fetch one positions page, retrying with exponential backoff.
+
+    Returns (positions, timing); positions is None when every attempt failed.
+    """
+    started = time.perf_counter()
+    positions = None
+    attempts = 0
+    for attempt in range(POSITION_PAGE_RETRIES):
+        attempts += 1
+        try:
+            # Every page is needed, so pages queue for a slot instead of failing fast
+            r = gateway.get(f"/portfolio/{account_id}/positions/{page}", max_wait=None)
+            if r.status_code == 200 and r.content:
+                data = r.json()
+                if isinstance(data, list):
+                    positions = data
+                    break
+        except ValueError:
+            pass
+        if attempt + 1 < POSITION_PAGE_RETRIES:
+            time.sleep(POSITION_PAGE_BACKOFF * 2 ** attempt)
+    return positions, {
+        "page": page,
+        "positions": len(positions) if positions is not None else None,
+        "attempts": attempts,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def load_positions(account_id):
+    """Fetch every positions page: page 0 first, then the rest in concurrent windows until an empty page"""
+    started = time.perf_counter()
+    first, timing = fetch_page(account_id, 0)
+    if first is None:
+        return None
+
+    pages = {0: first}
+    timings = [timing]
+    page_size = len(first)
+    next_page = 1
+    done = page_size == 0
+
+    while not done:
+        window = range(next_page, next_page + POSITION_PAGE_WORKERS)
+        for page, (positions, timing) in zip(window, _executor.map(metrics.bind(lambda p: fetch_page(account_id, p)), window)):
+            timings.append(timing)
+            if positions is None:
+                # A page that never loaded means the result can't be trusted as complete
+                return None
+            pages[page] = positions
+            if len(positions) < page_size:
+                done = True
+        next_page += POSITION_PAGE_WORKERS
+
+    return {
+        "positions": [p for page in sorted(pages) for p in pages[page]],
+        "pages": timings,
+        "fetched": time.time(),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def _refresh(account_id):
+    try:
+        result = load_positions(account_id)
+        if result is not None:
+            shared_cache.put(f"positions:{account_id}", result)
+        return result
+    finally:
+        with _lock:
+            _refreshing.discard(account_id)
+
+def get_positions(account_id, refresh=False):
+    """Return every position for an account, cached for POSITIONS_CACHE_TTL seconds.
+
+    Results older than that but within POSITIONS_MAX_STALE are returned immediately
+    while a background refresh runs. Returns None if positions couldn't be loaded.
+    """
+    cached = shared_cache.get(f"positions:{account_id}")
+    with _lock:
+        age = time.time() - cached["fetched"] if cached else None
+        if cached and not refresh:
+            if age < POSITIONS_CACHE_TTL:
+                metrics.cache_result("positions", "hit")
+                return cached
+            if age < POSITIONS_MAX_STALE:
+                metrics.cache_result("positions", "stale")
+                if account_id not in _refreshing:
+                    _refreshing.add(account_id)
+                    threading.Thread(target=_refresh, args=(account_id,), daemon=True).start()
+                return cached
+        _refreshing.add(account_id)
+    metrics.cache_result("positions", "miss")
+    return _refresh(account_id)
+
+def get_summary(account_id):
+    r = gateway.get(f"/portfolio/{account_id}/summary")
+    if r.status_code == 200 and r.content:
+        return r.json()
+    return None
+
+def merge_positions(positions_by_account):
+    """Merge positions from several accounts by conid, keeping a per-account breakdown"""
+    merged = {}
+    for account_id, positions in positions_by_account.items():
+        for position in positions:
+            conid = position["conid"]
+            if conid not in merged:
+                merged[conid] = dict(position, position=0, mktValue=0, unrealizedPnl=0, avgCost=0, accounts=[])
+            row = merged[conid]
+            cost = row["avgCost"] * row["position"] + position.get("avgCost", 0) * position.get("position", 0)
+            row["position"] += position.get("position", 0)
+            row["mktValue"] += position.get("mktValue", 0)
+            row["unrealizedPnl"] += position.get("unrealizedPnl", 0)
+            row["avgCost"] = cost / row["position"] if row["position"] else 0
+            row["accounts"].append({
+                "id": account_id,
+                "position": position.get("position", 0),
+                "avgCost": position.get("avgCost", 0),
+                "mktValue": position.get("mktValue", 0),
+                "unrealizedPnl": position.get("unrealizedPnl", 0)
+            })
+    return list(merged.values())
+
+def merge_summaries(summaries):
+    """Add up numeric summary amounts that share a currency across accounts"""
+    totals = {}
+    for summary in summaries:
+        for key, value in (summary or {}).items():
+            if not isinstance(value, dict) or not isinstance(value.get("amount"), (int, float)):
+                continue
+            total = totals.setdefault(key, {"amount": 0, "currency": value.get("currency")})
+            if total is None or total["currency"] != value.get("currency"):
+                totals[key] = None  # mixed currencies can't be summed
+                continue
+            total["amount"] += value["amount"]
+    return {key: total for key, total in totals.items() if total is not None}
+
+def aggregate_portfolio():
+    """Fetch summary and positions for every account in parallel and consolidate them"""
+    started = time.perf_counter()
+    accounts = get_accounts()
+    if not accounts:
+        return None
+
+    summaries = [_account_executor.submit(metrics.bind(get_summary), account["id"]) for account in accounts]
+    positions = [_account_executor.submit(metrics.bind(get_positions), account["id"]) for account in accounts]
+    loaded = [(account, summary.result(), result.result()) for account, summary, result in zip(accounts, summaries, positions)]
+    return {
+        "accounts": [
+            {"account": account, "summary": summary, "positions": positions["positions"] if positions else None}
+            for account, summary, positions in loaded
+        ],
+        "summary": merge_summaries(summary for _, summary, _ in loaded),
+        "positions": merge_positions({
+            account["id"]: positions["positions"]
+            for account, _, positions in loaded
+            if positions
+        }),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
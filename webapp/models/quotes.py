@@ -0,0 +1,122 @@
+import fcntl
+import os
+import threading
+import time
+from datetime import datetime
+from webapp.models import gateway, metrics, shared_cache
+from webapp.models.db import DATA_DIR
+from webapp.models.snapshot import SNAPSHOT_BATCH_SIZE, SNAPSHOT_FIELDS, chunk, fetch_snapshots, parse_field
+
+QUOTE_POLL_INTERVAL = float(os.environ.get('QUOTE_POLL_INTERVAL', 5))
+QUOTE_MAX_REQUESTS_PER_SEC = float(os.environ.get('QUOTE_MAX_REQUESTS_PER_SEC', 5))
+# Held by whichever worker process is currently polling
+QUOTE_POLLER_LOCK = os.path.join(DATA_DIR, 'quote_poller.lock')
+
+_poller = {"thread": None, "stop": None}
+
+# Quotes live in the shared cache as "quote:<conid>" -> {"price", "price_change", "price_change_pct", "volume", "updated"}
+def _key(conid):
+    return f"quote:{conid}"
+
+def _quote(market_data, previous=None):
+    """Stored quote for a snapshot; fields the snapshot lacks keep their previous value instead of becoming 0"""
+    quote = {key: (previous or {}).get(key, 0) for key in SNAPSHOT_FIELDS.values()}
+    quote.update({key: parse_field(market_data[field]) for field, key in SNAPSHOT_FIELDS.items() if field in market_data})
+    quote["updated"] = time.time()
+    return quote
+
+def get_quote(conid):
+    return shared_cache.get(_key(conid))
+
+def get_quotes(conids):
+    """{conid: quote} for the conids that have one"""
+    stored = shared_cache.get_many(dict.fromkeys(_key(conid) for conid in conids))
+    return {key.split(":", 1)[1]: quote for key, quote in stored.items()}
+
+def store_updates(updates):
+    """Merge {conid: market_data} field updates, from snapshots or the stream, into the quote store"""
+    if not updates:
+        return
+    previous = shared_cache.get_many(_key(conid) for conid in updates)
+    shared_cache.put_many({
+        _key(conid): _quote(market_data, previous.get(_key(conid)))
+        for conid, market_data in updates.items()
+    })
+
+def refresh_quotes(conids, batch_size=None):
+    """Fetch snapshots for conids into the quote store and return the batch timings"""
+    quotes, timings = fetch_snapshots(conids, batch_size)
+    store_updates(quotes)
+    return timings
+
+def apply_quotes(instruments):
+    """Copy stored quotes onto instruments, adding quote_age in seconds; unquoted instruments get 0s, as _quote does"""
+    now = time.time()
+    quotes = shared_cache.get_many(dict.fromkeys(_key(i["conid"]) for i in instruments))
+    metrics.cache_result("quotes", "hit", len(quotes))
+    metrics.cache_result("quotes", "miss", len({str(i["conid"]) for i in instruments}) - len(quotes))
+    for instrument in instruments:
+        quote = quotes.get(_key(instrument["conid"]))
+        if not quote:
+            for key in SNAPSHOT_FIELDS.values():
+                instrument.setdefault(key, 0)
+            instrument["quote_age"] = None
+            continue
+        for key in SNAPSHOT_FIELDS.values():
+            instrument[key] = quote[key]
+        instrument["last_update"] = datetime.fromtimestamp(quote["updated"]).strftime("%Y-%m-%d %H:%M:%S")
+        instrument["quote_age"] = round(now - quote["updated"], 1)
+
+def acquire_leadership(path=QUOTE_POLLER_LOCK):
+    """Take a process lock without blocking; returns the open lock file, or None if another process holds it"""
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR, exist_ok=True)
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return lock_file
+    except OSError:
+        lock_file.close()
+        return None
+
+def _poll(get_conids, stop):
+    # Every worker runs a poller thread but only the lock holder polls; the others take over if it exits
+    gateway.wait_for_tokens()
+    leadership = None
+    while not stop.is_set():
+        started = time.monotonic()
+        if leadership is None:
+            leadership = acquire_leadership()
+            if leadership is None:
+                stop.wait(QUOTE_POLL_INTERVAL)
+                continue
+        try:
+            conids = list(dict.fromkeys(str(c) for c in get_conids()))
+            for batch in chunk(conids, SNAPSHOT_BATCH_SIZE):
+                refresh_quotes(batch)
+                # Stay inside the snapshot request budget
+                if stop.wait(1 / QUOTE_MAX_REQUESTS_PER_SEC):
+                    break
+        except Exception as e:
+            metrics.error("quote_poller", e, "Quote poller error")
+        stop.wait(max(0, QUOTE_POLL_INTERVAL - (time.monotonic() - started)))
+    if leadership is not None:
+        leadership.close()
+
+def start_poller(get_conids):
+    """Keep the quote store fresh for every conid returned by get_conids()"""
+    if poller_running():
+        return _poller["thread"]
+    stop = threading.Event()
+    thread = threading.Thread(target=_poll, args=(get_conids, stop), name="quote-poller", daemon=True)
+    _poller["thread"], _poller["stop"] = thread, stop
+    thread.start()
+    return thread
+
+def stop_poller():
+    if _poller["stop"]:
+        _poller["stop"].set()
+    _poller["thread"] = None
+
+def poller_running():
+    return _poller["thread"] is not None and _poller["thread"].is_alive()
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from webapp.models import gateway, metrics, shared_cache
+
+SCANNER_PARAMS_FILE = 'webapp/data/scanner_params.json'
+SCANNER_PARAMS_TTL = float(os.environ.get('SCANNER_PARAMS_TTL', 24 * 3600))
+SCAN_RESULT_TTL = float(os.environ.get('SCAN_RESULT_TTL', 60))
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', 8))
+
+_lock = threading.Lock()
+_catalog = {}
+
+def build_indexes(params):
+    """Build the instrument -> filters/sorts/locations and filter group maps used by the scanner form"""
+    scanner_map = {}
+    filter_map = {}
+
+    for item in params['instrument_list']:
+        scanner_map[item['type']] = {
+            "display_name": item['display_name'],
+            "filters": item['filters'],
+            "sorts": [],
+            "locations": []
+        }
+
+    for item in params['filter_list']:
+        filter_map[item['group']] = {
+            "display_name": item['display_name'],
+            "type": item['type'],
+            "code": item['code']
+        }
+
+    for item in params['scan_type_list']:
+        for instrument in item['instruments']:
+            if instrument in scanner_map:
+                scanner_map[instrument]['sorts'].append({
+                    "name": item['display_name'],
+                    "code": item['code']
+                })
+
+    for item in params['location_tree']:
+        if item['type'] in scanner_map:
+            scanner_map[item['type']]['locations'] = item['locations']
+
+    return scanner_map, filter_map
+
+def _read_disk():
+    if not os.path.exists(SCANNER_PARAMS_FILE):
+        return None
+    try:
+        with open(SCANNER_PARAMS_FILE, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        return None
+
+def _write_disk(stored):
+    directory = os.path.dirname(SCANNER_PARAMS_FILE)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    # Per-process name: workers refreshing at the same time must not rename each other's file
+    tmp = f"{SCANNER_PARAMS_FILE}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(stored, f)
+    os.replace(tmp, SCANNER_PARAMS_FILE)
+
+def _fetch():
+    r = gateway.get("/iserver/scanner/params")
+    params = r.json()
+    if r.status_code != 200 or 'instrument_list' not in params:
+        raise ValueError(f"Unexpected scanner params response ({r.status_code})")
+    stored = {"fetched": time.time(), "params": params}
+    _write_disk(stored)
+    return stored
+
+def _load(stored):
+    scanner_map, filter_map = build_indexes(stored["params"])
+    script = f"const scannerMap = {json.dumps(scanner_map)};\nconst filterMap = {json.dumps(filter_map)};\n"
+    _catalog.clear()
+    _catalog.update({
+        "fetched": stored["fetched"],
+        "scanner_map": scanner_map,
+        "filter_map": filter_map,
+        # Pre-serialized once so pages can reference it instead of embedding it
+        "script": script,
+        "etag": hashlib.sha1(script.encode()).hexdigest()
+    })
+
+def get_catalog(refresh=False):
+    """Return the scanner catalog, refetching /iserver/scanner/params once SCANNER_PARAMS_TTL has passed"""
+    with _lock:
+        if not refresh and _catalog and time.time() - _catalog["fetched"] < SCANNER_PARAMS_TTL:
+            return _catalog
+
+        stored = None if refresh else _read_disk()
+        if not stored or time.time() - stored["fetched"] >= SCANNER_PARAMS_TTL:
+            try:
+                stored = _fetch()
+            except Exception as e:
+                # Keep serving a stale catalog rather than failing the page
+                metrics.error("scanner", e, "Error refreshing scanner params")
+                stored = stored or _read_disk()
+                if not stored:
+                    if _catalog:
+                        return _catalog
+                    raise
+
+        if not _catalog or stored["fetched"] != _catalog["fetched"]:
+            _load(stored)
+        return _catalog
+
+def normalize_scan(definition):
+    """Return the /iserver/scanner/run payload for a scan definition, with filters in a stable order"""
+    filters = [
+        {"code": f["code"], "value": f.get("value", "")}
+        for f in definition.get("filter", [])
+        if f.get("code")
+    ]
+    return {
+        "instrument": definition.get("instrument", ""),
+        "location": definition.get("location", ""),
+        "type": definition.get("type", ""),
+        "filter": sorted(filters, key=lambda f: (f["code"], str(f["value"])))
+    }
+
+def run_scan(definition, max_wait=...):
+    """Run one scan, serving results cached for SCAN_RESULT_TTL seconds by (instrument, location, type, filters).
+
+    max_wait is passed to gateway.post; run_scans uses None so its scans queue on the scanner limit.
+    """
+    payload = normalize_scan(definition)
+    # Results are shared between worker processes
+    key = "scan:" + json.dumps(payload, sort_keys=True)
+    started = time.perf_counter()
+
+    cached = shared_cache.get(key, SCAN_RESULT_TTL)
+    metrics.cache_result("scan_results", bool(cached))
+    if cached:
+        return {"definition": payload, "results": cached["results"], "cached": True, "error": None,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    error = None
+    results = {}
+    try:
+        r = gateway.post("/iserver/scanner/run", json=payload, max_wait=max_wait)
+        results = r.json()
+        if r.status_code == 200:
+            shared_cache.put(key, {"fetched": time.time(), "results": results})
+        else:
+            error = f"HTTP {r.status_code}"
+    except Exception as e:
+        error = str(e)
+
+    return {"definition": payload, "results": results, "cached": False, "error": error,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+def run_scans(definitions, max_workers=None):
+    """Run many scans concurrently and merge their contracts, de-duplicated by conid.
+
+    Each merged contract lists the indexes of the scans that returned it under "scans". Scans
+    wait their turn on the gateway's one-per-second scanner limit rather than failing.
+    """
+    definitions = list(definitions)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or SCAN_WORKERS) as executor:
+        scans = list(executor.map(metrics.bind(lambda definition: run_scan(definition, max_wait=None)), definitions))
+
+    contracts = {}
+    for index, scan in enumerate(scans):
+        if not isinstance(scan["results"], dict):
+            continue
+        for contract in scan["results"].get("contracts", []):
+            conid = str(contract.get("con_id", contract.get("conid")))
+            if conid not in contracts:
+                contracts[conid] = dict(contract, scans=[])
+            contracts[conid]["scans"].append(index)
+
+    return {
+        "scans": scans,
+        "contracts": list(contracts.values()),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+import time
+from webapp.models.db import connect
+
+# Key/value store shared by every worker process; values are JSON
+CACHE_DB = 'cache.db'
+# Entries not rewritten for this long are deleted; live quotes, scans and positions are rewritten far more often
+SHARED_CACHE_MAX_AGE = float(os.environ.get('SHARED_CACHE_MAX_AGE', 7 * 24 * 3600))
+PURGE_INTERVAL = float(os.environ.get('SHARED_CACHE_PURGE_INTERVAL', 600))
+
+_purge_lock = threading.Lock()
+_last_purge = 0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    stored REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_stored ON cache (stored);
+"""
+
+def _db():
+    return connect(CACHE_DB, _SCHEMA)
+
+def get(key, max_age=None):
+    """Return the value stored under key, or None if missing or older than max_age seconds"""
+    row = _db().execute("SELECT value, stored FROM cache WHERE key = ?", (key,)).fetchone()
+    if row is None or (max_age is not None and time.time() - row["stored"] >= max_age):
+        return None
+    return json.loads(row["value"])
+
+def get_many(keys, max_age=None):
+    """Return {key: value} for the keys that are stored (and fresh, given max_age)"""
+    keys = list(keys)
+    conn = _db()
+    oldest = time.time() - max_age if max_age is not None else 0
+    values = {}
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        rows = conn.execute(
+            f"SELECT key, value FROM cache WHERE stored >= ? AND key IN ({','.join('?' * len(chunk))})",
+            [oldest] + chunk
+        )
+        values.update({row["key"]: json.loads(row["value"]) for row in rows})
+    return values
+
+def put(key, value):
+    put_many({key: value})
+
+def put_many(items):
+    now = time.time()
+    conn = _db()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO cache (key, value, stored) VALUES (?, ?, ?)",
+            [(key, json.dumps(value), now) for key, value in items.items()]
+        )
+    purge_if_due()
+
+def delete(key):
+    conn = _db()
+    with conn:
+        conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+def purge(max_age=None):
+    """Delete entries older than max_age seconds (default SHARED_CACHE_MAX_AGE), returning how many went"""
+    conn = _db()
+    with conn:
+        return conn.execute(
+            "DELETE FROM cache WHERE stored < ?", (time.time() - (max_age or SHARED_CACHE_MAX_AGE),)
+        ).rowcount
+
+def purge_if_due():
+    """Run purge() if PURGE_INTERVAL has passed since this process last did"""
+    global _last_purge
+    with _purge_lock:
+        if time.monotonic() - _last_purge < PURGE_INTERVAL:
+            return
+        _last_purge = time.monotonic()
+    purge()
@@ -0,0 +1,79 @@
+import logging
+import os
+import time
+from webapp.models import gateway, metrics
+
+SNAPSHOT_BATCH_SIZE = int(os.environ.get('SNAPSHOT_BATCH_SIZE', 100))
+
+logger = logging.getLogger(__name__)
+
+# Snapshot field codes mapped onto instrument keys
+SNAPSHOT_FIELDS = {
+    "31": "price",             # Last price
+    "32": "price_change",      # Change
+    "33": "price_change_pct",  # Change %
+    "34": "volume",            # Volume
+}
+
+def parse_field(value):
+    """Turn a snapshot field such as 'C182.50', '1.2M' or '-0.35%' into a float"""
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).strip().replace(',', '').rstrip('%')
+    multiplier = 1
+    if text[-1:] in ('K', 'M', 'B'):
+        multiplier = {'K': 1e3, 'M': 1e6, 'B': 1e9}[text[-1]]
+        text = text[:-1]
+    text = text.lstrip('CH')  # closing / halted price prefixes
+    try:
+        return float(text) * multiplier
+    except ValueError:
+        return 0
+
+def chunk(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def fetch_snapshots(conids, batch_size=None):
+    """Fetch snapshot fields for many conids using multi-conid requests.
+
+    Returns ({conid: market_data}, [batch timing, ...]).
+    """
+    batch_size = batch_size or SNAPSHOT_BATCH_SIZE
+    unique_conids = list(dict.fromkeys(str(c) for c in conids if c))
+    quotes = {}
+    timings = []
+
+    for number, batch in enumerate(chunk(unique_conids, batch_size)):
+        started = time.perf_counter()
+        error = None
+        try:
+            r = gateway.get(
+                "/iserver/marketdata/snapshot",
+                params={"conids": ",".join(batch), "fields": ",".join(SNAPSHOT_FIELDS)}
+            )
+            if r.status_code == 200:
+                for market_data in r.json() or []:
+                    # The first snapshot for a new subscription often carries no fields yet
+                    if any(field in market_data for field in SNAPSHOT_FIELDS):
+                        quotes[str(market_data.get("conid"))] = market_data
+            else:
+                error = f"HTTP {r.status_code}"
+        except Exception as e:
+            error = str(e)
+        elapsed = time.perf_counter() - started
+        metrics.observe("snapshot_batch_duration_seconds", elapsed)
+        metrics.inc("snapshot_batch_conids_total", len(batch))
+        if error:
+            metrics.inc("errors_total", component="snapshot", type="batch")
+            logger.warning("Snapshot batch %d (%d conids) failed after %.1fms: %s", number, len(batch), elapsed * 1000, error)
+        else:
+            logger.debug("Snapshot batch %d: %d conids in %.1fms", number, len(batch), elapsed * 1000)
+        timings.append({
+            "batch": number,
+            "conids": len(batch),
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "error": error
+        })
+
+    return quotes, timings
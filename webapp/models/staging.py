@@ -0,0 +1,122 @@
+import json
+import os
+import time
+import uuid
+from webapp.models.db import connect
+
+STAGING_DB = 'staging.db'
+STAGING_TTL = float(os.environ.get('STAGING_TTL', 3600))
+STAGING_PAGE_SIZE = int(os.environ.get('STAGING_PAGE_SIZE', 100))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    upload_id TEXT PRIMARY KEY,
+    watchlist TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS staged_symbols (
+    upload_id TEXT NOT NULL REFERENCES uploads (upload_id) ON DELETE CASCADE,
+    failed INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    conid TEXT,
+    selected INTEGER NOT NULL DEFAULT 1,
+    latency_ms REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (upload_id, failed, row)
+);
+"""
+
+def _db():
+    return connect(STAGING_DB, _SCHEMA)
+
+def purge_expired():
+    conn = _db()
+    with conn:
+        expired = [row["upload_id"] for row in conn.execute(
+            "SELECT upload_id FROM uploads WHERE created < ?", (time.time() - STAGING_TTL,)
+        )]
+        for upload_id in expired:
+            conn.execute("DELETE FROM staged_symbols WHERE upload_id = ?", (upload_id,))
+            conn.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+
+def _row_data(symbol):
+    return json.dumps({key: value for key, value in symbol.items() if key != "latency_ms"})
+
+def create(watchlist_name, successful_symbols, failed_symbols):
+    """Stage resolved symbols for review and return the upload ID; each row's latency_ms goes in its own column"""
+    purge_expired()
+    upload_id = uuid.uuid4().hex
+    conn = _db()
+    with conn:
+        conn.execute(
+            "INSERT INTO uploads (upload_id, watchlist, created) VALUES (?, ?, ?)",
+            (upload_id, watchlist_name, time.time())
+        )
+        conn.executemany(
+            "INSERT INTO staged_symbols (upload_id, failed, row, conid, latency_ms, data) VALUES (?, 0, ?, ?, ?, ?)",
+            [(upload_id, row, str(s["conid"]), s.get("latency_ms"), _row_data(s))
+             for row, s in enumerate(successful_symbols)]
+        )
+        conn.executemany(
+            "INSERT INTO staged_symbols (upload_id, failed, row, conid, latency_ms, data) VALUES (?, 1, ?, NULL, ?, ?)",
+            [(upload_id, row, s.get("latency_ms"), _row_data(s))
+             for row, s in enumerate(failed_symbols)]
+        )
+    return upload_id
+
+def get(upload_id):
+    """Return the upload's watchlist name and row counts, or None if it expired or doesn't exist"""
+    if not upload_id:
+        return None
+    conn = _db()
+    upload = conn.execute(
+        "SELECT watchlist FROM uploads WHERE upload_id = ? AND created >= ?",
+        (upload_id, time.time() - STAGING_TTL)
+    ).fetchone()
+    if upload is None:
+        return None
+    counts = dict(conn.execute(
+        "SELECT failed, COUNT(*) FROM staged_symbols WHERE upload_id = ? GROUP BY failed", (upload_id,)
+    ).fetchall())
+    return {
+        "watchlist_name": upload["watchlist"],
+        "successful_count": counts.get(0, 0),
+        "failed_count": counts.get(1, 0)
+    }
+
+def get_page(upload_id, failed, page, per_page=None):
+    """Return one page of staged rows, each with its selected flag and lookup latency"""
+    per_page = per_page or STAGING_PAGE_SIZE
+    rows = _db().execute(
+        "SELECT data, selected, latency_ms FROM staged_symbols "
+        "WHERE upload_id = ? AND failed = ? ORDER BY row LIMIT ? OFFSET ?",
+        (upload_id, int(failed), per_page, max(page - 1, 0) * per_page)
+    )
+    symbols = []
+    for row in rows:
+        symbol = json.loads(row["data"])
+        symbol["selected"] = bool(row["selected"])
+        symbol["latency_ms"] = row["latency_ms"]
+        symbols.append(symbol)
+    return symbols
+
+def set_selection(upload_id, shown_conids, selected_conids):
+    """Record which of the conids shown on a page are ticked"""
+    conn = _db()
+    with conn:
+        conn.executemany(
+            "UPDATE staged_symbols SET selected = ? WHERE upload_id = ? AND failed = 0 AND conid = ?",
+            [(int(conid in selected_conids), upload_id, conid) for conid in shown_conids]
+        )
+
+def selected_symbols(upload_id):
+    return [json.loads(row["data"]) for row in _db().execute(
+        "SELECT data FROM staged_symbols WHERE upload_id = ? AND failed = 0 AND selected = 1 ORDER BY row",
+        (upload_id,)
+    )]
+
+def discard(upload_id):
+    conn = _db()
+    with conn:
+        conn.execute("DELETE FROM staged_symbols WHERE upload_id = ?", (upload_id,))
+        conn.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
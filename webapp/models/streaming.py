@@ -0,0 +1,157 @@
+import json
+import os
+import ssl
+import threading
+import time
+import websocket
+from webapp.models import gateway, metrics
+from webapp.models.db import DATA_DIR
+from webapp.models.quotes import acquire_leadership, get_quotes, store_updates
+from webapp.models.snapshot import SNAPSHOT_FIELDS
+
+STREAM_URL = os.environ.get('IBKR_STREAM_URL', gateway.BASE_API_URL.replace("https://", "wss://").replace("http://", "ws://") + "/ws")
+# How often watchlist changes are turned into subscribe/unsubscribe messages
+STREAM_SYNC_INTERVAL = float(os.environ.get('STREAM_SYNC_INTERVAL', 5))
+# Field updates are batched into the quote store this often
+STREAM_FLUSH_INTERVAL = float(os.environ.get('STREAM_FLUSH_INTERVAL', 0.25))
+STREAM_RECONNECT_DELAY = float(os.environ.get('STREAM_RECONNECT_DELAY', 5))
+# The gateway drops idle sockets, so send a heartbeat well within its timeout
+STREAM_HEARTBEAT_INTERVAL = float(os.environ.get('STREAM_HEARTBEAT_INTERVAL', 50))
+# How often an SSE client is checked for changed quotes
+SSE_PUSH_INTERVAL = float(os.environ.get('SSE_PUSH_INTERVAL', 0.5))
+SSE_KEEPALIVE_INTERVAL = float(os.environ.get('SSE_KEEPALIVE_INTERVAL', 15))
+# Held by whichever worker process owns the socket
+STREAM_LOCK = os.path.join(DATA_DIR, 'quote_stream.lock')
+
+_stream = {"thread": None, "stop": None, "connected": False, "subscribed": set(), "messages": 0}
+
+def subscribe_message(conid):
+    return f"smd+{conid}+{json.dumps({'fields': list(SNAPSHOT_FIELDS)})}"
+
+def unsubscribe_message(conid):
+    return f"umd+{conid}+{{}}"
+
+def parse_message(message):
+    """Return (conid, fields) for a market data update, or None for system, status and heartbeat messages"""
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not str(data.get("topic", "")).startswith("smd+"):
+        return None
+    conid = data.get("conid") or data["topic"].split("+", 1)[1]
+    fields = {field: data[field] for field in SNAPSHOT_FIELDS if field in data}
+    if not fields:
+        return None
+    return str(conid), fields
+
+def _session_token():
+    """The gateway ties the socket to the REST session through the token returned by /tickle"""
+    try:
+        r = gateway.post("/tickle")
+        if r.status_code == 200:
+            return r.json().get("session")
+    except Exception as e:
+        metrics.error("quote_stream", e, "Error fetching stream session")
+    return None
+
+def _sync_subscriptions(ws, wanted):
+    subscribed = _stream["subscribed"]
+    for conid in wanted - subscribed:
+        ws.send(subscribe_message(conid))
+    for conid in subscribed - wanted:
+        ws.send(unsubscribe_message(conid))
+    _stream["subscribed"] = set(wanted)
+
+def _run_socket(get_conids, stop):
+    sslopt = {} if gateway.VERIFY_SSL else {"cert_reqs": ssl.CERT_NONE, "check_hostname": False}
+    ws = websocket.create_connection(STREAM_URL, timeout=10, sslopt=sslopt)
+    _stream["connected"] = True
+    _stream["subscribed"] = set()
+    try:
+        session = _session_token()
+        if session:
+            ws.send(json.dumps({"session": session}))
+        ws.settimeout(STREAM_FLUSH_INTERVAL)
+        pending = {}
+        next_sync = next_flush = next_heartbeat = 0
+        while not stop.is_set():
+            now = time.monotonic()
+            if now >= next_sync:
+                _sync_subscriptions(ws, {str(c) for c in get_conids()})
+                next_sync = now + STREAM_SYNC_INTERVAL
+            if now >= next_heartbeat:
+                ws.send("tic")
+                next_heartbeat = now + STREAM_HEARTBEAT_INTERVAL
+            try:
+                message = ws.recv()
+            except websocket.WebSocketTimeoutException:
+                message = None
+            update = parse_message(message) if message else None
+            if update:
+                _stream["messages"] += 1
+                pending.setdefault(update[0], {}).update(update[1])
+            if pending and now >= next_flush:
+                store_updates(pending)
+                pending = {}
+                next_flush = now + STREAM_FLUSH_INTERVAL
+        store_updates(pending)
+    finally:
+        _stream["connected"] = False
+        _stream["subscribed"] = set()
+        ws.close()
+
+def _run(get_conids, stop):
+    # Like the poller, every worker runs this thread but only the lock holder opens a socket
+    gateway.wait_for_tokens()
+    leadership = None
+    while not stop.is_set():
+        if leadership is None:
+            leadership = acquire_leadership(STREAM_LOCK)
+            if leadership is None:
+                stop.wait(STREAM_RECONNECT_DELAY)
+                continue
+        try:
+            _run_socket(get_conids, stop)
+        except Exception as e:
+            metrics.error("quote_stream", e, "Quote stream error")
+        stop.wait(STREAM_RECONNECT_DELAY)
+    if leadership is not None:
+        leadership.close()
+
+def start_stream(get_conids):
+    """Stream market data for every conid returned by get_conids() into the quote store"""
+    if stream_running():
+        return _stream["thread"]
+    stop = threading.Event()
+    thread = threading.Thread(target=_run, args=(get_conids, stop), name="quote-stream", daemon=True)
+    _stream["thread"], _stream["stop"] = thread, stop
+    thread.start()
+    return thread
+
+def stop_stream():
+    if _stream["stop"]:
+        _stream["stop"].set()
+    _stream["thread"] = None
+
+def stream_running():
+    return _stream["thread"] is not None and _stream["thread"].is_alive()
+
+def quote_events(conids):
+    """Server-sent events carrying {conid: quote} whenever a quote in conids changes"""
+    conids = [str(c) for c in conids]
+    sent = {}
+    last_event = time.monotonic()
+    while True:
+        changed = {
+            conid: quote for conid, quote in get_quotes(conids).items()
+            if sent.get(conid) != quote["updated"]
+        }
+        if changed:
+            sent.update({conid: quote["updated"] for conid, quote in changed.items()})
+            last_event = time.monotonic()
+            yield f"event: quotes\ndata: {json.dumps(changed)}\n\n"
+        elif time.monotonic() - last_event >= SSE_KEEPALIVE_INTERVAL:
+            last_event = time.monotonic()
+            yield ": keep-alive\n\n"
+        time.sleep(SSE_PUSH_INTERVAL)
@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+from webapp.models.db import connect
+
+SYMBOL_CACHE_DB = 'symbols.db'
+SYMBOL_CACHE_TTL = float(os.environ.get('SYMBOL_CACHE_TTL', 7 * 24 * 3600))
+SYMBOL_CACHE_SIZE = int(os.environ.get('SYMBOL_CACHE_SIZE', 50000))
+# Don't rewrite the LRU timestamp on every hit
+TOUCH_INTERVAL = 60
+# Eviction scans the whole table, so puts only trigger it this often
+EVICT_INTERVAL = float(os.environ.get('SYMBOL_CACHE_EVICT_INTERVAL', 60))
+
+_evict_lock = threading.Lock()
+_last_evict = 0
+
+def normalize(symbol):
+    return (symbol or "").strip().upper()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS symbol_cache (
+    symbol TEXT PRIMARY KEY,
+    results TEXT NOT NULL,
+    complete INTEGER NOT NULL,
+    fetched REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbol_cache_used ON symbol_cache (used);
+"""
+
+def _db():
+    return connect(SYMBOL_CACHE_DB, _SCHEMA)
+
+def get(symbol, complete=True):
+    """Return cached search results for a symbol, or None on a miss.
+
+    complete=False also accepts the single-match entries warmed from watchlists,
+    which is enough for callers that only take the first match.
+    """
+    conn = _db()
+    row = conn.execute(
+        "SELECT results, complete, fetched, used FROM symbol_cache WHERE symbol = ?",
+        (normalize(symbol),)
+    ).fetchone()
+    now = time.time()
+    if row is None or now - row["fetched"] > SYMBOL_CACHE_TTL:
+        return None
+    if complete and not row["complete"]:
+        return None
+    if now - row["used"] > TOUCH_INTERVAL:
+        with conn:
+            conn.execute("UPDATE symbol_cache SET used = ? WHERE symbol = ?", (now, normalize(symbol)))
+    return json.loads(row["results"])
+
+def put(symbol, results, complete=True):
+    conn = _db()
+    now = time.time()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO symbol_cache (symbol, results, complete, fetched, used) VALUES (?, ?, ?, ?, ?)",
+            (normalize(symbol), json.dumps(results), int(complete), now, now)
+        )
+    evict_if_due()
+
+def evict_if_due():
+    """Run evict() if EVICT_INTERVAL has passed since this process last did"""
+    global _last_evict
+    with _evict_lock:
+        if time.monotonic() - _last_evict < EVICT_INTERVAL:
+            return
+        _last_evict = time.monotonic()
+    evict()
+
+def evict():
+    """Drop expired entries and the least recently used ones beyond SYMBOL_CACHE_SIZE"""
+    conn = _db()
+    with conn:
+        conn.execute("DELETE FROM symbol_cache WHERE fetched < ?", (time.time() - SYMBOL_CACHE_TTL,))
+        conn.execute("""
+            DELETE FROM symbol_cache WHERE symbol IN (
+                SELECT symbol FROM symbol_cache ORDER BY used DESC LIMIT -1 OFFSET ?
+            )
+        """, (SYMBOL_CACHE_SIZE,))
+
+def warm(instruments):
+    """Seed the cache with symbol -> conid pairs already saved in watchlists"""
+    conn = _db()
+    now = time.time()
+    rows = []
+    for instrument in instruments:
+        if not instrument.get("symbol") or not instrument.get("conid"):
+            continue
+        rows.append((normalize(instrument["symbol"]), json.dumps([{
+            "symbol": instrument["symbol"],
+            "conid": instrument["conid"],
+            "companyName": instrument.get("company_name", ""),
+            "description": instrument.get("description", "")
+        }]), now, now))
+    with conn:
+        # Never overwrite a real search result with a warmed entry
+        conn.executemany(
+            "INSERT OR IGNORE INTO symbol_cache (symbol, results, complete, fetched, used) VALUES (?, ?, 0, ?, ?)",
+            rows
+        )
+    evict_if_due()
+    return len(rows)
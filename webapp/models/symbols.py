@@ -0,0 +1,66 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from webapp.models import gateway, metrics, symbol_cache
+
+RESOLVE_WORKERS = int(os.environ.get('SYMBOL_RESOLVE_WORKERS', 8))
+
+def search_symbol(symbol, complete=True, max_wait=...):
+    """Return the /iserver/secdef/search matches for a symbol, consulting the resolution cache first"""
+    cached = symbol_cache.get(symbol, complete=complete)
+    metrics.cache_result("symbols", cached is not None)
+    if cached is not None:
+        return cached
+
+    r = gateway.get("/iserver/secdef/search", params={"symbol": symbol, "name": "true"}, max_wait=max_wait)
+    results = r.json()
+    if r.status_code == 200 and isinstance(results, list) and results:
+        symbol_cache.put(symbol, results)
+    return results
+
+def resolve_symbol(symbol):
+    """(symbol, (stock, failure reason), latency ms) for the first search match.
+
+    Resolution runs in batches, so searches queue for a rate limit slot rather than recording
+    symbols the gateway never refused as failed.
+    """
+    started = time.perf_counter()
+    try:
+        results = search_symbol(symbol, complete=False, max_wait=None)
+        if results and len(results) > 0:
+            # Take the first match
+            stock = results[0]
+            resolved = {
+                "symbol": stock['symbol'],
+                "conid": stock['conid'],
+                "company_name": stock.get('companyName', ''),
+                "description": stock.get('description', '')
+            }, None
+        else:
+            resolved = None, "Symbol not found"
+    except Exception as e:
+        resolved = None, str(e)
+    return symbol, resolved, round((time.perf_counter() - started) * 1000, 1)
+
+def resolve_symbols(symbols, max_workers=None):
+    """Resolve symbols concurrently.
+
+    Returns (successful_symbols, failed_symbols), both in input order, with each row carrying
+    its search time in milliseconds as latency_ms; the gateway may rename a ticker, so the
+    timing travels with the row rather than being looked up by symbol.
+    """
+    successful_symbols = []
+    failed_symbols = []
+
+    with ThreadPoolExecutor(max_workers=max_workers or RESOLVE_WORKERS) as executor:
+        for symbol, (stock, reason), latency_ms in executor.map(metrics.bind(resolve_symbol), symbols):
+            if stock:
+                successful_symbols.append(dict(stock, latency_ms=latency_ms))
+            else:
+                failed_symbols.append({
+                    "symbol": symbol,
+                    "reason": reason,
+                    "latency_ms": latency_ms
+                })
+
+    return successful_symbols, failed_symbols
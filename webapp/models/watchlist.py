@@ -1,27 +1,32 @@
-import json
-import os
-import requests
-from datetime import datetime
+from webapp.models import watchlist_store
+from webapp.models.quotes import apply_quotes, poller_running, refresh_quotes
+from webapp.models.streaming import stream_running
 
+# Legacy whole-file store, imported into the SQLite store on first use
 WATCHLIST_FILE = 'webapp/data/watchlists.json'
-BASE_API_URL = "https://localhost:5055/v1/api"
+
+_initialized = False
 
 def init_watchlists():
-    if not os.path.exists('webapp/data'):
-        os.makedirs('webapp/data')
-    if not os.path.exists(WATCHLIST_FILE):
-        with open(WATCHLIST_FILE, 'w') as f:
-            json.dump({"watchlists": []}, f)
+    global _initialized
+    if not _initialized:
+        watchlist_store.migrate_json(WATCHLIST_FILE)
+        _initialized = True
 
-def get_watchlists(sort_by=None, filter_by=None):
+def load_watchlists():
+    """Structural read: watchlists and instruments from storage, without market data"""
     init_watchlists()
-    with open(WATCHLIST_FILE, 'r') as f:
-        watchlists = json.load(f)
+    return watchlist_store.load_all()
+
+def get_watchlists(sort_by=None, filter_by=None):
+    """Priced read for display routes: structure plus quotes, sorted and filtered"""
+    watchlists = load_watchlists()
     
-    # Update prices for all instruments
-    for watchlist in watchlists["watchlists"]:
-        for instrument in watchlist["instruments"]:
-            update_instrument_price(instrument)
+    instruments = [i for watchlist in watchlists["watchlists"] for i in watchlist["instruments"]]
+    # The background poller or stream keeps the quote store fresh; without them refresh inline, batched across watchlists
+    if not poller_running() and not stream_running():
+        refresh_quotes([i["conid"] for i in instruments])
+    apply_quotes(instruments)
     
     if sort_by and watchlists["watchlists"]:
         for watchlist in watchlists["watchlists"]:
@@ -51,56 +56,40 @@ def matches_filter(instrument, filter_by):
     return True
 
 def update_instrument_price(instrument):
-    try:
-        r = requests.get(
-            f"{BASE_API_URL}/iserver/marketdata/snapshot?conids={instrument['conid']}", 
-            verify=False
-        )
-        if r.status_code == 200:
-            data = r.json()
-            if data and len(data) > 0:
-                market_data = data[0]
-                instrument["price"] = market_data.get("31", 0)  # Last price
-                instrument["price_change"] = market_data.get("32", 0)  # Change
-                instrument["price_change_pct"] = market_data.get("33", 0)  # Change %
-                instrument["volume"] = market_data.get("34", 0)  # Volume
-                instrument["last_update"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    except Exception as e:
-        print(f"Error updating price for {instrument['symbol']}: {str(e)}")
+    refresh_quotes([instrument["conid"]])
+    apply_quotes([instrument])
+
+def get_watchlist_instruments():
+    init_watchlists()
+    return watchlist_store.all_instruments()
+
+def get_watchlist_conids():
+    init_watchlists()
+    return watchlist_store.all_conids()
 
 def save_watchlists(watchlists):
-    with open(WATCHLIST_FILE, 'w') as f:
-        json.dump(watchlists, f, indent=2)
+    """Replace every watchlist in one transaction; routes use the row-level mutations below instead"""
+    init_watchlists()
+    watchlist_store.replace_all(watchlists)
+
+# Mutations only touch the changed rows and report what changed; the page redirected to loads what it shows
 
 def create_watchlist(name):
-    watchlists = get_watchlists()
-    watchlists["watchlists"].append({
-        "name": name,
-        "instruments": []
-    })
-    save_watchlists(watchlists)
-    return watchlists
+    init_watchlists()
+    return watchlist_store.create(name)
 
 def add_to_watchlist(watchlist_name, instrument):
-    watchlists = get_watchlists()
-    for watchlist in watchlists["watchlists"]:
-        if watchlist["name"] == watchlist_name:
-            if instrument not in watchlist["instruments"]:
-                update_instrument_price(instrument)
-                watchlist["instruments"].append(instrument)
-    save_watchlists(watchlists)
-    return watchlists
+    return add_many_to_watchlist(watchlist_name, [instrument]) > 0
+
+def add_many_to_watchlist(watchlist_name, instruments):
+    """Add several instruments in a single storage write, returning how many were new"""
+    init_watchlists()
+    return watchlist_store.add(watchlist_name, instruments)
 
 def remove_from_watchlist(watchlist_name, instrument_id):
-    watchlists = get_watchlists()
-    for watchlist in watchlists["watchlists"]:
-        if watchlist["name"] == watchlist_name:
-            watchlist["instruments"] = [i for i in watchlist["instruments"] if i["conid"] != instrument_id]
-    save_watchlists(watchlists)
-    return watchlists
+    init_watchlists()
+    return watchlist_store.remove(watchlist_name, instrument_id)
 
 def delete_watchlist(watchlist_name):
-    watchlists = get_watchlists()
-    watchlists["watchlists"] = [w for w in watchlists["watchlists"] if w["name"] != watchlist_name]
-    save_watchlists(watchlists)
-    return watchlists
\ No newline at end of file
+    init_watchlists()
+    return watchlist_store.delete(watchlist_name)
\ No newline at end of file
@@ -0,0 +1,120 @@
+import json
+import os
+from webapp.models.db import connect, write_transaction
+
+WATCHLIST_DB = 'watchlists.db'
+# Display-only keys that are never persisted
+TRANSIENT_KEYS = ("quote_age",)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlists (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS instruments (
+    watchlist TEXT NOT NULL REFERENCES watchlists (name) ON DELETE CASCADE,
+    conid TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (watchlist, conid)
+);
+CREATE INDEX IF NOT EXISTS instruments_conid ON instruments (conid);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def _db():
+    return connect(WATCHLIST_DB, _SCHEMA)
+
+def migrate_json(path):
+    """Import a legacy watchlists.json once; the file itself is left in place as a backup"""
+    conn = _db()
+    # Every worker runs this at startup; only the first one through imports the file
+    with write_transaction(conn):
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+            return False
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                legacy = json.load(f)
+            _replace_all(conn, legacy)
+        conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_json', ?)", (path,))
+    return True
+
+def _replace_all(conn, watchlists):
+    conn.execute("DELETE FROM instruments")
+    conn.execute("DELETE FROM watchlists")
+    for position, watchlist in enumerate(watchlists["watchlists"]):
+        conn.execute(
+            "INSERT OR IGNORE INTO watchlists (name, position) VALUES (?, ?)",
+            (watchlist["name"], position)
+        )
+        _insert_instruments(conn, watchlist["name"], watchlist["instruments"])
+
+def _insert_instruments(conn, watchlist_name, instruments):
+    next_position = conn.execute(
+        "SELECT COALESCE(MAX(position), -1) + 1 FROM instruments WHERE watchlist = ?",
+        (watchlist_name,)
+    ).fetchone()[0]
+    added = 0
+    for instrument in instruments:
+        instrument = {k: v for k, v in instrument.items() if k not in TRANSIENT_KEYS}
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO instruments (watchlist, conid, position, data) VALUES (?, ?, ?, ?)",
+            (watchlist_name, str(instrument["conid"]), next_position + added, json.dumps(instrument))
+        )
+        added += cursor.rowcount
+    return added
+
+def replace_all(watchlists):
+    conn = _db()
+    with write_transaction(conn):
+        _replace_all(conn, watchlists)
+
+def load_all():
+    """Return every watchlist as {"watchlists": [{"name", "instruments"}]} in creation order"""
+    conn = _db()
+    watchlists = {
+        row["name"]: {"name": row["name"], "instruments": []}
+        for row in conn.execute("SELECT name FROM watchlists ORDER BY position")
+    }
+    for row in conn.execute("SELECT watchlist, data FROM instruments ORDER BY watchlist, position"):
+        watchlists[row["watchlist"]]["instruments"].append(json.loads(row["data"]))
+    return {"watchlists": list(watchlists.values())}
+
+def create(watchlist_name):
+    """Add an empty watchlist at the end, returning False if the name is taken"""
+    conn = _db()
+    with conn:
+        return conn.execute(
+            "INSERT OR IGNORE INTO watchlists (name, position) "
+            "SELECT ?, COALESCE(MAX(position), -1) + 1 FROM watchlists",
+            (watchlist_name,)
+        ).rowcount > 0
+
+def add(watchlist_name, instruments):
+    """Append instruments whose conid isn't already in the watchlist, returning how many were added"""
+    conn = _db()
+    with write_transaction(conn):
+        if not conn.execute("SELECT 1 FROM watchlists WHERE name = ?", (watchlist_name,)).fetchone():
+            return 0
+        return _insert_instruments(conn, watchlist_name, instruments)
+
+def remove(watchlist_name, conid):
+    """Remove an instrument, returning whether it was in the watchlist"""
+    conn = _db()
+    with conn:
+        return conn.execute(
+            "DELETE FROM instruments WHERE watchlist = ? AND conid = ?", (watchlist_name, str(conid))
+        ).rowcount > 0
+
+def delete(watchlist_name):
+    """Delete a watchlist and its instruments, returning whether it existed"""
+    conn = _db()
+    with conn:
+        conn.execute("DELETE FROM instruments WHERE watchlist = ?", (watchlist_name,))
+        return conn.execute("DELETE FROM watchlists WHERE name = ?", (watchlist_name,)).rowcount > 0
+
+def all_instruments():
+    return [json.loads(row["data"]) for row in _db().execute("SELECT data FROM instruments")]
+
+def all_conids():
+    return [row["conid"] for row in _db().execute("SELECT DISTINCT conid FROM instruments")]